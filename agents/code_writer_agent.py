@@ -40,20 +40,31 @@ Getting LLMs to write clean, runnable code requires careful prompting:
 
 import os
 import re
-from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage
+from typing import List
+from langchain_core.messages import HumanMessage, SystemMessage
 from state import AnalystState
-from prompts.prompts import CODE_WRITER_PROMPT
+from llm import (
+    get_llm, cached_invoke, acached_invoke, cached_batch, prompt_cache_options
+)
+from tools.dataframe_loader import prefetch_dataframe
+from agents.schema_agent import summary_columns
+from prompts.prompts import (
+    CODE_WRITER_SYSTEM_PROMPT, CODE_WRITER_USER_PROMPT, CODE_WRITER_RETRY_PROMPT
+)
 
-# Load environment variables from .env file
-load_dotenv()
+# Model used for code generation. Falls back to the shared OPENAI_MODEL so
+# existing .env files keep working; set CODE_WRITER_MODEL to override.
+CODE_WRITER_MODEL = os.getenv("CODE_WRITER_MODEL", os.getenv("OPENAI_MODEL", "gpt-4o"))
 
-# Get configuration from environment variables
-# BASE_URL allows using alternative OpenAI-compatible APIs (e.g., Azure, local LLMs)
-# OPENAI_API_KEY is your authentication token for the API
-BASE_URL = os.getenv("BASE_URL", "https://api.openai.com/v1")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Upper bound on response length. A typical analysis script is well under 800
+# tokens; the cap only stops pathological runaway completions.
+CODE_WRITER_MAX_TOKENS = 1500
+
+# How much of the rejected attempt's output is quoted back on a retry
+RETRY_RESULT_MAX_CHARS = 2000
+
+# Maximum number of code requests in flight at once in code_writer_agent_batch()
+CODE_WRITER_BATCH_CONCURRENCY = 8
 
 
 def code_writer_agent(state: AnalystState) -> dict:
@@ -101,6 +112,29 @@ def code_writer_agent(state: AnalystState) -> dict:
     parsed_intent = state["parsed_intent"]
     dataframe_summary = state["dataframe_summary"]
     
+    # critic_agent rejected the previous answer and the graph looped back
+    # here (see should_retry() in graph.py). We must write DIFFERENT code
+    # this time, so the template and the cached response are not an option:
+    # the prompt carries the rejected attempt and the critique instead.
+    is_retry = _is_retry(state)
+    
+    # Start parsing the CSV in a background thread while we wait for the LLM.
+    # executor_agent picks up the finished DataFrame instead of re-reading it.
+    # If the file is missing, the executor will report that error itself.
+    csv_path = state.get("csv_path")
+    if csv_path:
+        try:
+            prefetch_dataframe(csv_path)
+        except OSError:
+            pass
+    
+    # Trivial intents ("top 5 product by sales") have a known-good template,
+    # so we can skip the LLM round-trip entirely. See match_intent_template().
+    if not is_retry:
+        template_code = match_intent_template(parsed_intent, dataframe_summary)
+        if template_code is not None:
+            return {"generated_code": template_code}
+    
     # =========================================================================
     # STEP 2: Initialize the LLM client
     # =========================================================================
@@ -110,24 +144,31 @@ def code_writer_agent(state: AnalystState) -> dict:
     #
     # Code generation benefits significantly from more capable models.
     # GPT-3.5 can write basic code but makes more errors with complex logic.
+    #
+    # get_llm() returns a client shared across calls (and agents), so we
+    # reuse its HTTP connection pool instead of opening a new one each time.
+    # max_tokens is a generous safety cap, not a target.
     # =========================================================================
     
-    llm = ChatOpenAI(
-        base_url=BASE_URL,
-        api_key=OPENAI_API_KEY,
-        model=os.getenv("OPENAI_MODEL", "gpt-4o"),
-        temperature=0  # Deterministic output - we want reliable code
+    llm = get_llm(
+        CODE_WRITER_MODEL,
+        temperature=0,  # Deterministic output - we want reliable code
+        max_tokens=CODE_WRITER_MAX_TOKENS
     )
     
     # =========================================================================
     # STEP 3: Build the prompt
     # =========================================================================
-    # The CODE_WRITER_PROMPT template includes:
-    # - Clear instructions on how to structure the code
-    # - The dataset schema (so the LLM knows what columns exist)
-    # - The analysis instruction from intent_agent
-    # - Rules about variable naming and what NOT to include
-    # - Requirements for comments and code quality
+    # The prompt is split into two messages:
+    # - CODE_WRITER_SYSTEM_PROMPT: clear instructions on how to structure the
+    #   code, rules about variable naming and what NOT to include, and the
+    #   dataset schema (so the LLM knows what columns exist)
+    # - CODE_WRITER_USER_PROMPT: the analysis instruction from intent_agent
+    #
+    # WHY TWO MESSAGES?
+    # Providers cache prompts by exact prefix match. The system message is
+    # identical for every question asked about the same dataset, so only the
+    # short user message at the end is "new" tokens on repeat queries.
     #
     # PROMPT ENGINEERING CHOICES:
     # 
@@ -144,19 +185,33 @@ def code_writer_agent(state: AnalystState) -> dict:
     #    - Backticks would cause a SyntaxError
     #
     # 4. We request inline comments for the user's learning benefit.
+    #
+    # On a retry, _user_prompt() appends the rejected code, its output, and
+    # the critique (CODE_WRITER_RETRY_PROMPT) to the user message. The
+    # system message is unchanged, so the cached prefix still applies.
     # =========================================================================
     
-    prompt = CODE_WRITER_PROMPT.format(
-        dataframe_summary=dataframe_summary,
-        parsed_intent=parsed_intent
-    )
+    messages = [
+        SystemMessage(content=CODE_WRITER_SYSTEM_PROMPT.format(
+            dataframe_summary=dataframe_summary
+        )),
+        HumanMessage(content=_user_prompt(state))
+    ]
     
     # =========================================================================
     # STEP 4: Call the LLM to generate code
     # =========================================================================
     
-    response = llm.invoke([HumanMessage(content=prompt)])
-    raw_response = response.content
+    # cached_invoke() returns the stored response when this exact request
+    # (same model, same messages) was already answered - e.g. on a Streamlit
+    # re-run or a retry - and only calls the API on a cache miss.
+    #
+    # prompt_cache_options() adds a routing key derived from the dataset
+    # summary, so the provider serves every question about this dataset from
+    # the same cached prefix (OpenAI API only; a no-op for other backends).
+    raw_response = cached_invoke(
+        llm, messages, **prompt_cache_options(dataframe_summary)
+    )
     
     # =========================================================================
     # STEP 5: Clean the generated code
@@ -169,19 +224,25 @@ def code_writer_agent(state: AnalystState) -> dict:
     # 2. Code wrapped in ``` ... ``` blocks (no language specified)
     # 3. Leading/trailing whitespace
     #
-    # The regex pattern below handles both cases robustly.
+    # The fence, when present, is always at the start/end of the text, so
+    # strip_markdown_code_blocks() handles both cases with simple string checks.
     # =========================================================================
     
     cleaned_code = strip_markdown_code_blocks(raw_response)
     
+    if is_retry:
+        return {
+            "generated_code": cleaned_code,
+            "retry_count": state.get("retry_count", 0) + 1
+        }
+    
     # =========================================================================
     # STEP 6: Return the generated code
     # =========================================================================
     # The cleaned code is now ready to be executed by executor_agent.
     # It should contain:
     # - import statements (pandas, plotly)
-    # - data loading (pd.read_csv(csv_path))
-    # - data manipulation (filtering, grouping, etc.)
+    # - data manipulation on the pre-loaded `df` (filtering, grouping, etc.)
     # - visualization (fig = px.bar(...) or similar)
     # - optional text result (result_text = "...")
     # =========================================================================
@@ -189,6 +250,163 @@ def code_writer_agent(state: AnalystState) -> dict:
     return {"generated_code": cleaned_code}
 
 
+async def acode_writer_agent(state: AnalystState) -> dict:
+    """
+    Async version of code_writer_agent().
+    
+    LangGraph uses this when the graph runs with ainvoke()/astream() (for
+    example under `langgraph dev` / LangGraph Studio). Inputs and outputs
+    are identical; the difference is that the LLM request is awaited, so
+    the event loop stays free for other runs while we wait on the network.
+    
+    The CSV prefetch still runs in its background thread, concurrently with
+    the awaited LLM call.
+    """
+    
+    csv_path = state.get("csv_path")
+    if csv_path:
+        try:
+            prefetch_dataframe(csv_path)
+        except OSError:
+            pass
+    
+    is_retry = _is_retry(state)
+    
+    if not is_retry:
+        template_code = match_intent_template(
+            state["parsed_intent"], state["dataframe_summary"]
+        )
+        if template_code is not None:
+            return {"generated_code": template_code}
+    
+    llm = get_llm(
+        CODE_WRITER_MODEL,
+        temperature=0,
+        max_tokens=CODE_WRITER_MAX_TOKENS
+    )
+    
+    messages = [
+        SystemMessage(content=CODE_WRITER_SYSTEM_PROMPT.format(
+            dataframe_summary=state["dataframe_summary"]
+        )),
+        HumanMessage(content=_user_prompt(state))
+    ]
+    
+    raw_response = await acached_invoke(
+        llm, messages, **prompt_cache_options(state["dataframe_summary"])
+    )
+    
+    update = {"generated_code": strip_markdown_code_blocks(raw_response)}
+    if is_retry:
+        update["retry_count"] = state.get("retry_count", 0) + 1
+    return update
+
+
+def code_writer_agent_batch(states: List[AnalystState]) -> List[dict]:
+    """
+    Generate code for several analyses with one batched LLM call.
+    
+    This is the batch form of code_writer_agent(): each state gets the same
+    prompt it would get on its own, but all requests are sent together with
+    llm.batch() (concurrently, one batch per dataset) instead of one
+    round-trip after another. Requests already in the response cache are
+    not sent at all.
+    
+    Parameters:
+    -----------
+    states : List[AnalystState]
+        One state per analysis, each with "parsed_intent" and
+        "dataframe_summary" (and optionally "csv_path" for prefetching)
+        
+    Returns:
+    --------
+    List[dict]
+        One {"generated_code": ...} update per input state, in order
+    """
+    
+    # Start parsing every distinct CSV while the requests are in flight
+    for csv_path in {state.get("csv_path") for state in states}:
+        if csv_path:
+            try:
+                prefetch_dataframe(csv_path)
+            except OSError:
+                pass
+    
+    llm = get_llm(
+        CODE_WRITER_MODEL,
+        temperature=0,
+        max_tokens=CODE_WRITER_MAX_TOKENS
+    )
+    
+    # Answer trivial intents from the template table; only the rest go out
+    # (retries always go to the LLM, see code_writer_agent())
+    codes = [
+        None if _is_retry(state)
+        else match_intent_template(state["parsed_intent"], state["dataframe_summary"])
+        for state in states
+    ]
+    pending = [i for i, code in enumerate(codes) if code is None]
+    
+    # The requests are grouped by dataset: prompt_cache_options() routes
+    # every request about one dataset to the same provider cache (as in
+    # code_writer_agent()), and the option applies to a whole batch call
+    by_summary = {}
+    for i in pending:
+        by_summary.setdefault(states[i]["dataframe_summary"], []).append(i)
+    
+    for dataframe_summary, indices in by_summary.items():
+        message_lists = [
+            [
+                SystemMessage(content=CODE_WRITER_SYSTEM_PROMPT.format(
+                    dataframe_summary=dataframe_summary
+                )),
+                HumanMessage(content=_user_prompt(states[i]))
+            ]
+            for i in indices
+        ]
+        raw_responses = cached_batch(
+            llm, message_lists,
+            max_concurrency=CODE_WRITER_BATCH_CONCURRENCY,
+            **prompt_cache_options(dataframe_summary)
+        )
+        for i, raw_response in zip(indices, raw_responses):
+            codes[i] = strip_markdown_code_blocks(raw_response)
+    
+    updates = []
+    for state, code in zip(states, codes):
+        update = {"generated_code": code}
+        if _is_retry(state):
+            update["retry_count"] = state.get("retry_count", 0) + 1
+        updates.append(update)
+    return updates
+
+
+def _is_retry(state: AnalystState) -> bool:
+    """True when critic_agent rejected this run's previous answer."""
+    return state.get("critic_score") == "FAIL" and bool(state.get("generated_code"))
+
+
+def _user_prompt(state: AnalystState) -> str:
+    """
+    Build the code writer's user message for this state.
+    
+    A first attempt gets just the analysis instruction. A retry also gets
+    the rejected code, (the start of) its output, and the critic's reason,
+    so the LLM can fix what was wrong instead of repeating it.
+    """
+    
+    prompt = CODE_WRITER_USER_PROMPT.format(parsed_intent=state["parsed_intent"])
+    
+    if _is_retry(state):
+        prompt += CODE_WRITER_RETRY_PROMPT.format(
+            generated_code=state["generated_code"],
+            execution_result=state.get("execution_result", "")[:RETRY_RESULT_MAX_CHARS],
+            critique=state.get("critique", "")
+        )
+    
+    return prompt
+
+
 def strip_markdown_code_blocks(text: str) -> str:
     """
     Remove markdown code block formatting from LLM output.
@@ -220,9 +438,9 @@ def strip_markdown_code_blocks(text: str) -> str:
     """
     
     # =========================================================================
-    # PATTERN EXPLANATION:
+    # HOW THE STRIPPING WORKS:
     # =========================================================================
-    # The regex pattern handles multiple markdown code block formats:
+    # This handles multiple markdown code block formats:
     #
     # ```python         <- Opening with language specifier
     # code here
@@ -232,27 +450,191 @@ def strip_markdown_code_blocks(text: str) -> str:
     # code here
     # ```               <- Closing
     #
-    # The pattern:
-    # - ^```(\w+)?    matches opening ``` optionally followed by language name
-    # - \n?           matches optional newline after opening
-    # - (.*?)         captures the code (non-greedy)
-    # - \n?```$       matches closing with optional newline before
-    #
-    # re.DOTALL makes . match newlines too
+    # A fence can only appear at the boundaries of the response, so we don't
+    # need a regex (which scans the whole text). Instead we:
+    # - Check if the text starts with ```
+    # - Drop the opening line (``` plus the optional language name)
+    # - Drop a trailing ``` if present
     # =========================================================================
     
-    # Pattern to match code blocks with or without language specifier
-    pattern = r'^```(?:\w+)?\n?(.*?)\n?```$'
-    
-    # Try to match and extract the code
-    match = re.match(pattern, text.strip(), re.DOTALL)
+    code = text.strip()
     
-    if match:
-        # Found a code block - extract just the code
-        return match.group(1).strip()
-    else:
+    if not code.startswith("```"):
         # No code block found - return as-is (already clean)
-        return text.strip()
+        return code
+    
+    # Drop the opening fence line (```python, ```py, or just ```)
+    first_newline = code.find("\n")
+    code = code[first_newline + 1:] if first_newline != -1 else code[3:]
+    
+    # Drop the closing fence
+    if code.endswith("```"):
+        code = code[:-3]
+
+    return code.strip()
+
+
+# =============================================================================
+# TEMPLATES FOR TRIVIAL INTENTS
+# =============================================================================
+# Some parsed intents are simple enough that we don't need an LLM to write
+# the code: "top 5 product by sales", "average price by region", ...
+# For those we match the intent against a small table of patterns and fill
+# in a known-good code template - no API call, no tokens, <1 ms.
+#
+# SAFETY RULES:
+# - Patterns must match the WHOLE intent. If the intent adds anything we
+#   don't handle (a filter, a date range), it's not a match.
+# - Every column name must exist in the dataframe_summary, and aggregated
+#   columns must be numeric. Otherwise we fall back to the LLM.
+# - Column names are embedded with repr(), so they're always valid literals.
+# =============================================================================
+
+# pandas dtype names that support sum/mean/etc.
+_NUMERIC_DTYPE_PREFIXES = ("int", "uint", "float", "Int", "UInt", "Float")
+
+# Words accepted for each pandas aggregation
+_AGGREGATIONS = {
+    "sum": "sum", "total": "sum",
+    "average": "mean", "mean": "mean",
+    "median": "median",
+    "max": "max", "maximum": "max",
+    "min": "min", "minimum": "min",
+}
+
+
+def _summary_columns(dataframe_summary: str) -> dict:
+    """Map lower-cased column name -> (column name, dtype) from the summary."""
+    return {
+        name.lower(): (name, dtype)
+        for name, dtype in summary_columns(dataframe_summary)
+    }
+
+
+def _resolve_column(columns: dict, raw: str, numeric: bool = False):
+    """Return the real column name for raw (quotes optional), or None."""
+    entry = columns.get(raw.strip().strip("'\"`").lower())
+    if entry is None:
+        return None
+    name, dtype = entry
+    if numeric and not dtype.startswith(_NUMERIC_DTYPE_PREFIXES):
+        return None
+    return name
+
+
+def _template_top_n(match, columns: dict):
+    """top N <group> by <value>  ->  bar chart of the N largest group totals."""
+    n = int(match.group("n"))
+    group = _resolve_column(columns, match.group("group"))
+    value = _resolve_column(columns, match.group("value"), numeric=True)
+    if group is None or value is None or group == value or n < 1:
+        return None
+
+    return "\n".join([
+        "import pandas as pd",
+        "import plotly.express as px",
+        "",
+        f"# Total {value} per {group}, keeping the top {n}",
+        f"top = df.groupby({group!r}, as_index=False)[{value!r}].sum().nlargest({n}, {value!r})",
+        "",
+        f"fig = px.bar(top, x={group!r}, y={value!r}, title={f'Top {n} {group} by {value}'!r})",
+        "result_text = top.to_string(index=False)",
+    ])
+
+
+def _template_group_aggregate(match, columns: dict):
+    """<agg> of <value> by <group>  ->  bar chart of the aggregate per group."""
+    aggregation = _AGGREGATIONS[match.group("agg").lower()]
+    group = _resolve_column(columns, match.group("group"))
+    value = _resolve_column(columns, match.group("value"), numeric=True)
+    if group is None or value is None or group == value:
+        return None
+
+    title = f"{match.group('agg').capitalize()} {value} by {group}"
+    return "\n".join([
+        "import pandas as pd",
+        "import plotly.express as px",
+        "",
+        f"# {aggregation} of {value} for each {group}",
+        f"summary = df.groupby({group!r}, as_index=False)[{value!r}].{aggregation}()",
+        f"summary = summary.sort_values({value!r}, ascending=False)",
+        "",
+        f"fig = px.bar(summary, x={group!r}, y={value!r}, title={title!r})",
+        "result_text = summary.to_string(index=False)",
+    ])
+
+
+def _template_row_count(match, columns: dict):
+    """count rows  ->  a single number."""
+    return "\n".join([
+        "import pandas as pd",
+        "",
+        "# Number of rows in the dataset",
+        "row_count = len(df)",
+        'result_text = f"The dataset has {row_count:,} rows."',
+    ])
+
+
+# (pattern, handler) pairs, tried in order. Handlers return code or None.
+_INTENT_TEMPLATES = [
+    (
+        re.compile(
+            r"(?:show |list |find |get )?(?:the )?top (?P<n>\d+) (?P<group>.+?) "
+            r"by (?:total |sum of )?(?P<value>.+)",
+            re.IGNORECASE
+        ),
+        _template_top_n
+    ),
+    (
+        re.compile(
+            r"(?:show |compute |calculate )?(?:the )?"
+            r"(?P<agg>" + "|".join(_AGGREGATIONS) + r") (?:of )?(?P<value>.+?) "
+            r"(?:grouped )?(?:by|per|for each) (?P<group>.+)",
+            re.IGNORECASE
+        ),
+        _template_group_aggregate
+    ),
+    (
+        re.compile(
+            r"(?:count|total number of|number of) (?:the )?rows(?: in the dataset)?",
+            re.IGNORECASE
+        ),
+        _template_row_count
+    ),
+]
+
+
+def match_intent_template(parsed_intent: str, dataframe_summary: str):
+    """
+    Return ready-to-run code if parsed_intent is a trivial known pattern.
+
+    Parameters:
+    -----------
+    parsed_intent : str
+        The instruction from intent_agent
+    dataframe_summary : str
+        The schema summary from schema_agent (used to validate columns)
+
+    Returns:
+    --------
+    str or None
+        Generated code, or None when the LLM should handle this intent
+    """
+
+    # Normalize: single spaces, no trailing period
+    intent = " ".join(parsed_intent.split()).rstrip(".").strip()
+
+    columns = None
+    for pattern, handler in _INTENT_TEMPLATES:
+        match = pattern.fullmatch(intent)
+        if match:
+            if columns is None:
+                columns = _summary_columns(dataframe_summary)
+            code = handler(match, columns)
+            if code is not None:
+                return code
+
+    return None
 
 
 # =============================================================================
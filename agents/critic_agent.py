@@ -47,32 +47,76 @@ WHY ENFORCE JSON OUTPUT:
 -----------------------
 We ask the LLM to respond in strict JSON format for several reasons:
 
-1. RELIABLE PARSING: We can use json.loads() to extract the score and reason
+1. RELIABLE PARSING: We can use a JSON parser to extract the score and reason
 2. STRUCTURE ENFORCEMENT: The LLM must think in terms of our required fields
 3. AUTOMATION: The Streamlit UI can programmatically display PASS vs FAIL
 
 This is a common pattern called "structured output" or "function calling"
 that makes LLM outputs machine-readable.
 
+On the OpenAI API we go one step further and send a JSON schema with the
+request (response_format={"type": "json_schema", ...}). The provider then
+constrains decoding so the response is ALWAYS a valid {"score", "reason"}
+object - no markdown fences, no extra prose. Other OpenAI-compatible
+backends may reject that field, so they get the prompt-only JSON request
+(see llm.structured_output_options) and parse_critic_response() handles
+whatever comes back.
+
 =============================================================================
 """
 
 import os
+import re
 import json
-from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage
+import orjson
+from langchain_core.messages import HumanMessage, SystemMessage
 from state import AnalystState
-from prompts.prompts import CRITIC_PROMPT
+from llm import get_llm, cached_invoke, acached_invoke, structured_output_options
+from prompts.prompts import CRITIC_SYSTEM_PROMPT, CRITIC_USER_PROMPT
+from tools.python_executor import NO_TEXT_RESULT
+
+# Model used for evaluation. PASS/FAIL judging is a much simpler task than
+# writing code, so a small model is plenty and is ~10x cheaper and faster.
+# Override with CRITIC_MODEL in .env to use a different one.
+CRITIC_MODEL = os.getenv("CRITIC_MODEL", "gpt-4o-mini")
 
-# Load environment variables from .env file
-load_dotenv()
+# Upper bound on response length. The answer is a 2-field JSON object with a
+# one-sentence reason (~40 tokens), so 120 leaves headroom while making sure
+# a rambling response can't add seconds of decoding time.
+CRITIC_MAX_TOKENS = 120
+
+# Structured output schema sent with critic requests to the OpenAI API.
+# "strict": True makes the provider guarantee the response matches it exactly.
+CRITIC_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "critic_result",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "score": {"type": "string", "enum": ["PASS", "FAIL"]},
+                "reason": {"type": "string"}
+            },
+            "required": ["score", "reason"],
+            "additionalProperties": False
+        }
+    }
+}
 
-# Get configuration from environment variables
-# BASE_URL allows using alternative OpenAI-compatible APIs (e.g., Azure, local LLMs)
-# OPENAI_API_KEY is your authentication token for the API
-BASE_URL = os.getenv("BASE_URL", "https://api.openai.com/v1")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Patterns used by parse_critic_response(), compiled once at import time
+# JSON inside a ```json ... ``` (or plain ```) code block
+_CODE_BLOCK_RE = re.compile(r'```(?:json)?\s*(\{.*?\})\s*```', re.DOTALL)
+# A flat JSON object containing a "score" key, anywhere in the text
+_JSON_OBJECT_RE = re.compile(r'\{[^{}]*"score"[^{}]*\}', re.DOTALL)
+
+# Used by quick_verdict() to compare the question's words with the narrative's
+_WORD_RE = re.compile(r"[a-z0-9_]+")
+_STOPWORDS = frozenset(
+    "the and for with what which who how many much are was were show give "
+    "list find get from into this that these those per each all any does "
+    "did can could please tell about over by chart plot graph me our".split()
+)
 
 
 def critic_agent(state: AnalystState) -> dict:
@@ -121,31 +165,55 @@ def critic_agent(state: AnalystState) -> dict:
     narrative = state["narrative"]
     execution_result = state["execution_result"]
     
+    # Clear-cut cases (a chart-only answer, code that produced nothing, or a
+    # narrative that covers every key term of the question) don't need an
+    # LLM to judge them.
+    quick_result = quick_verdict(
+        user_question, narrative, execution_result, state.get("chart_json")
+    )
+    if quick_result is not None:
+        return {
+            "critic_score": quick_result["score"],
+            "critique": quick_result["reason"]
+        }
+    
     # =========================================================================
     # STEP 2: Initialize the LLM client
     # =========================================================================
     # For evaluation, we use temperature=0 for determinism.
     # We want consistent scoring - the same input should get the same score.
     #
-    # We also prefer a capable model (gpt-4o) because evaluation requires
-    # nuanced judgment about relevance and completeness.
+    # We use CRITIC_MODEL (gpt-4o-mini by default) rather than the flagship
+    # model: a binary PASS/FAIL judgment against a clear rubric doesn't need
+    # the extra capability, and the smaller model answers much faster.
+    #
+    # On the OpenAI API, response_format asks for JSON matching
+    # CRITIC_RESPONSE_FORMAT, so parsing below succeeds on the first attempt.
+    # Other backends get no response_format (many reject it with HTTP 400)
+    # and rely on the prompt's JSON instructions.
+    # max_tokens bounds decoding time - we only need one short sentence.
+    #
+    # get_llm() returns a client shared across calls (and agents), so we
+    # reuse its HTTP connection pool instead of opening a new one each time.
     # =========================================================================
     
-    llm = ChatOpenAI(
-        base_url=BASE_URL,
-        api_key=OPENAI_API_KEY,
-        model=os.getenv("OPENAI_MODEL", "gpt-4o"),
-        temperature=0  # Deterministic for consistent evaluation
+    llm = get_llm(
+        CRITIC_MODEL,
+        temperature=0,  # Deterministic for consistent evaluation
+        max_tokens=CRITIC_MAX_TOKENS,
+        model_kwargs=structured_output_options(CRITIC_RESPONSE_FORMAT)
     )
     
     # =========================================================================
     # STEP 3: Build the evaluation prompt
     # =========================================================================
-    # The CRITIC_PROMPT template:
-    # - Presents the original question, narrative, and results
+    # The CRITIC_SYSTEM_PROMPT (static rubric, sent first so it can be cached):
     # - Asks the LLM to evaluate relevance, specificity, completeness
     # - ENFORCES a strict JSON output format
     #
+    # The CRITIC_USER_PROMPT (dynamic, sent last):
+    # - Presents the original question, narrative, and results
+    #
     # JSON ENFORCEMENT:
     # We explicitly tell the LLM to respond in JSON format because:
     # 1. We need to programmatically extract the score
@@ -153,18 +221,23 @@ def critic_agent(state: AnalystState) -> dict:
     # 3. We store them in separate state fields
     # =========================================================================
     
-    prompt = CRITIC_PROMPT.format(
-        user_question=user_question,
-        narrative=narrative,
-        execution_result=execution_result
-    )
+    messages = [
+        SystemMessage(content=CRITIC_SYSTEM_PROMPT),
+        HumanMessage(content=CRITIC_USER_PROMPT.format(
+            user_question=user_question,
+            narrative=narrative,
+            execution_result=execution_result
+        ))
+    ]
     
     # =========================================================================
     # STEP 4: Call the LLM for evaluation
     # =========================================================================
     
-    response = llm.invoke([HumanMessage(content=prompt)])
-    raw_response = response.content
+    # cached_invoke() returns the stored response when this exact request
+    # (same model, same messages) was already answered - e.g. on a Streamlit
+    # re-run or a retry - and only calls the API on a cache miss.
+    raw_response = cached_invoke(llm, messages)
     
     # =========================================================================
     # STEP 5: Parse the JSON response
@@ -175,7 +248,9 @@ def critic_agent(state: AnalystState) -> dict:
     # We parse this JSON to extract the score and reason separately.
     #
     # DEFENSIVE PARSING:
-    # LLMs sometimes wrap JSON in markdown or include extra text.
+    # With response_format the response is already clean JSON, but other
+    # OpenAI-compatible backends are only asked for JSON by the prompt, and
+    # those LLMs sometimes wrap JSON in markdown or include extra text.
     # We use a helper function to robustly extract the JSON.
     # If parsing fails completely, we default to FAIL with an explanation.
     # =========================================================================
@@ -200,6 +275,136 @@ def critic_agent(state: AnalystState) -> dict:
     }
 
 
+async def acritic_agent(state: AnalystState) -> dict:
+    """
+    Async version of critic_agent().
+    
+    LangGraph uses this when the graph runs with ainvoke()/astream() (for
+    example under `langgraph dev` / LangGraph Studio). Inputs and outputs
+    are identical; the LLM request is awaited instead of blocking a thread.
+    """
+    
+    quick_result = quick_verdict(
+        state["user_question"], state["narrative"], state["execution_result"],
+        state.get("chart_json")
+    )
+    if quick_result is not None:
+        return {
+            "critic_score": quick_result["score"],
+            "critique": quick_result["reason"]
+        }
+    
+    llm = get_llm(
+        CRITIC_MODEL,
+        temperature=0,
+        max_tokens=CRITIC_MAX_TOKENS,
+        model_kwargs=structured_output_options(CRITIC_RESPONSE_FORMAT)
+    )
+    
+    messages = [
+        SystemMessage(content=CRITIC_SYSTEM_PROMPT),
+        HumanMessage(content=CRITIC_USER_PROMPT.format(
+            user_question=state["user_question"],
+            narrative=state["narrative"],
+            execution_result=state["execution_result"]
+        ))
+    ]
+    
+    raw_response = await acached_invoke(llm, messages)
+    critique_result = parse_critic_response(raw_response)
+    
+    return {
+        "critic_score": critique_result["score"],
+        "critique": critique_result["reason"]
+    }
+
+
+def quick_verdict(
+    user_question: str,
+    narrative: str,
+    execution_result: str,
+    chart_json: str = None
+):
+    """
+    Return a verdict without calling the LLM when the answer is clear-cut.
+    
+    This is deliberately conservative. It decides only three cases:
+    - a chart-only answer (the code drew a chart and set no result_text):
+      PASS. narrative_agent answers these with a fixed pointer to the chart,
+      which never repeats the question's terms, and the LLM critic only sees
+      that text - not the chart - so it would FAIL a good answer and start a
+      pointless retry.
+    - the code ran but produced neither a chart nor a result: FAIL, with a
+      reason the code writer can act on when it retries.
+    - the code ran without error AND every content word of the question
+      (ignoring short words and stopwords) appears in the narrative: PASS.
+    Anything less certain returns None so the LLM critic makes the call.
+    
+    Parameters:
+    -----------
+    user_question : str
+        What the user originally asked
+    narrative : str
+        The explanation generated by narrative_agent
+    execution_result : str
+        The text output (or error message) from executor_agent
+    chart_json : str
+        The chart from executor_agent (None when no chart was drawn)
+        
+    Returns:
+    --------
+    dict or None
+        {"score": "PASS" or "FAIL", "reason": "..."} or None to defer to the LLM
+    """
+    
+    result = (execution_result or "").strip()
+    
+    if result == NO_TEXT_RESULT:
+        if chart_json:
+            return {
+                "score": "PASS",
+                "reason": "The analysis ran successfully and answered with a chart."
+            }
+        return {
+            "score": "FAIL",
+            "reason": "The code ran but produced neither a chart (`fig`) nor a text result (`result_text`)."
+        }
+    
+    if not result or result.startswith("Error executing code"):
+        return None
+    
+    question_terms = {
+        word for word in _WORD_RE.findall(user_question.lower())
+        if len(word) >= 3 and word not in _STOPWORDS
+    }
+    # Too few terms to tell whether the narrative is on topic
+    if len(question_terms) < 2:
+        return None
+    
+    narrative_words = set(_WORD_RE.findall((narrative or "").lower()))
+    if not question_terms <= narrative_words:
+        return None
+    
+    return {
+        "score": "PASS",
+        "reason": "The analysis ran successfully and the narrative addresses every key term in the question."
+    }
+
+
+def _loads(text: str):
+    """
+    Parse JSON with orjson (several times faster), falling back to the
+    stdlib for the few inputs orjson rejects (e.g. NaN, huge integers).
+    
+    Raises json.JSONDecodeError when the text is not JSON at all - orjson's
+    error is a subclass of it, so callers only need to catch one type.
+    """
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
+        return json.loads(text)
+
+
 def parse_critic_response(response: str) -> dict:
     """
     Parse the critic LLM's JSON response into a structured dict.
@@ -239,7 +444,7 @@ def parse_critic_response(response: str) -> dict:
     # =========================================================================
     
     try:
-        result = json.loads(response.strip())
+        result = _loads(response.strip())
         return validate_critic_result(result)
     except json.JSONDecodeError:
         pass  # Try other extraction methods
@@ -250,15 +455,12 @@ def parse_critic_response(response: str) -> dict:
     # LLMs often wrap JSON in ```json ... ``` blocks despite instructions.
     # =========================================================================
     
-    import re
-    
     # Look for JSON in code blocks
-    code_block_pattern = r'```(?:json)?\s*(\{.*?\})\s*```'
-    match = re.search(code_block_pattern, response, re.DOTALL)
+    match = _CODE_BLOCK_RE.search(response)
     
     if match:
         try:
-            result = json.loads(match.group(1))
+            result = _loads(match.group(1))
             return validate_critic_result(result)
         except json.JSONDecodeError:
             pass
@@ -270,12 +472,11 @@ def parse_critic_response(response: str) -> dict:
     # We try to find the JSON object within the text.
     # =========================================================================
     
-    json_pattern = r'\{[^{}]*"score"[^{}]*\}'
-    match = re.search(json_pattern, response, re.DOTALL)
+    match = _JSON_OBJECT_RE.search(response)
     
     if match:
         try:
-            result = json.loads(match.group(0))
+            result = _loads(match.group(0))
             return validate_critic_result(result)
         except json.JSONDecodeError:
             pass
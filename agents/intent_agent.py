@@ -51,21 +51,55 @@ This precise instruction is much easier for the code_writer_agent to handle.
 """
 
 import os
-from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage
+import re
+import hashlib
+import threading
+import orjson
+from collections import OrderedDict
+from typing import List
+from langchain_core.messages import HumanMessage, SystemMessage
 from state import AnalystState
-from prompts.prompts import INTENT_PARSER_PROMPT
+from llm import (
+    get_llm, cached_invoke, acached_invoke, cached_batch,
+    prompt_cache_options, structured_output_options
+)
+from prompts.prompts import INTENT_PARSER_SYSTEM_PROMPT, INTENT_PARSER_USER_PROMPT
+from agents.schema_agent import summary_columns
 
-# Load environment variables from .env file
-# This allows us to keep API keys out of the code
-load_dotenv()
+# Model used for intent parsing. Rewriting one question into a short,
+# structured instruction doesn't need the flagship model; a small one is
+# much faster and cheaper. Override with INTENT_MODEL in .env.
+INTENT_MODEL = os.getenv("INTENT_MODEL", "gpt-4o-mini")
 
-# Get configuration from environment variables
-# BASE_URL allows using alternative OpenAI-compatible APIs (e.g., Azure, local LLMs)
-# OPENAI_API_KEY is your authentication token for the API
-BASE_URL = os.getenv("BASE_URL", "https://api.openai.com/v1")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Upper bound on response length - the instruction is a few sentences
+INTENT_MAX_TOKENS = 400
+
+# Structured output schema sent with intent requests to the OpenAI API
+# (other backends may reject it - see llm.structured_output_options).
+# "strict": True makes the provider guarantee the response matches it exactly.
+INTENT_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "parsed_intent",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "instruction": {"type": "string"},
+                "columns": {"type": "array", "items": {"type": "string"}},
+                "operation": {"type": "string"},
+                "filters": {"type": "string"},
+                "output_format": {"type": "string"},
+                "sorting": {"type": "string"}
+            },
+            "required": [
+                "instruction", "columns", "operation",
+                "filters", "output_format", "sorting"
+            ],
+            "additionalProperties": False
+        }
+    }
+}
 
 
 def intent_agent(state: AnalystState) -> dict:
@@ -110,7 +144,18 @@ def intent_agent(state: AnalystState) -> dict:
     # =========================================================================
     
     user_question = state["user_question"]
-    dataframe_summary = state["dataframe_summary"]
+    
+    # Column names + types are all intent parsing needs; keeping the schema
+    # small (and free of sample rows) keeps this prompt cheap and fast.
+    dataframe_summary = compact_summary(state["dataframe_summary"])
+    
+    # The same question about a table with the same columns always gets the
+    # same intent, so answer repeats from the intent cache (see
+    # _intent_cache_key) without building a prompt at all.
+    cache_key = _intent_cache_key(user_question, state["dataframe_summary"])
+    cached = _lookup_intent(cache_key)
+    if cached is not None:
+        return cached
     
     # =========================================================================
     # STEP 2: Initialize the LLM client
@@ -118,56 +163,74 @@ def intent_agent(state: AnalystState) -> dict:
     # We use LangChain's ChatOpenAI class to interact with OpenAI's API.
     # 
     # KEY PARAMETERS:
-    # - model: We use gpt-4o (or whatever is in OPENAI_MODEL env var) for
-    #   better understanding of nuanced questions. GPT-3.5 works too but
-    #   may produce less precise intent parsing.
+    # - model: We use gpt-4o-mini (or whatever is in INTENT_MODEL env var).
+    #   Rewriting one question is a small task, and the smaller model
+    #   answers several times faster.
     # - temperature: 0 means deterministic output (same input = same output).
     #   For intent parsing, we want consistency, not creativity.
+    # - response_format: asks for JSON matching INTENT_RESPONSE_FORMAT, so
+    #   the intent comes back already split into columns, operation, etc.
+    #   Only sent to the OpenAI API; other backends follow the prompt's
+    #   JSON instructions (or answer in plain text, which also works).
     #
     # The API key is loaded from the environment variable OPENAI_API_KEY.
+    #
+    # get_llm() returns a client shared across calls (and agents), so we
+    # reuse its HTTP connection pool instead of opening a new one each time.
     # =========================================================================
     
-    llm = ChatOpenAI(
-        base_url=BASE_URL,
-        api_key=OPENAI_API_KEY,
-        model=os.getenv("OPENAI_MODEL", "gpt-4o"),  # Default to gpt-4o
-        temperature=0  # Deterministic output for consistency
+    llm = get_llm(
+        INTENT_MODEL,
+        temperature=0,  # Deterministic output for consistency
+        max_tokens=INTENT_MAX_TOKENS,
+        model_kwargs=structured_output_options(INTENT_RESPONSE_FORMAT)
     )
     
     # =========================================================================
     # STEP 3: Build the prompt
     # =========================================================================
-    # We use a template from prompts.py and fill in the dynamic values.
-    # The template includes:
-    # - Instructions on how to parse the intent
-    # - The dataset structure
-    # - The user's question
-    # - Examples of good output
+    # The prompt is split into two messages:
+    # - INTENT_PARSER_SYSTEM_PROMPT: instructions on how to parse the intent
+    #   and an example of good output. It never changes.
+    # - INTENT_PARSER_USER_PROMPT: the dataset structure and the user's
+    #   question, filled in with .format()
     #
-    # Using .format() lets us inject the actual values into the template.
+    # WHY TWO MESSAGES?
+    # Providers cache prompts by exact prefix match. Putting the static
+    # instructions first (and the schema before the question) means repeat
+    # questions only pay full price for the short tail that actually changed.
     # =========================================================================
     
-    prompt = INTENT_PARSER_PROMPT.format(
-        dataframe_summary=dataframe_summary,
-        user_question=user_question
-    )
+    messages = [
+        SystemMessage(content=INTENT_PARSER_SYSTEM_PROMPT),
+        HumanMessage(content=INTENT_PARSER_USER_PROMPT.format(
+            dataframe_summary=dataframe_summary,
+            user_question=user_question
+        ))
+    ]
     
     # =========================================================================
     # STEP 4: Call the LLM
     # =========================================================================
     # LangChain uses a message-based API similar to OpenAI's chat API.
-    # We wrap our prompt in a HumanMessage and invoke the LLM.
+    # We send the system + human messages and invoke the LLM.
     #
     # The invoke() method:
-    # - Sends the message to the OpenAI API
+    # - Sends the messages to the OpenAI API
     # - Waits for the response
     # - Returns an AIMessage with the response content
     #
     # We use .content to extract just the text response.
+    #
+    # prompt_cache_options() adds a routing key derived from the dataset
+    # summary, so the provider serves every question about this dataset from
+    # the same cached prefix (OpenAI API only; a no-op for other backends).
     # =========================================================================
     
-    response = llm.invoke([HumanMessage(content=prompt)])
-    parsed_intent = response.content
+    raw_response = cached_invoke(
+        llm, messages, **prompt_cache_options(dataframe_summary)
+    )
+    parsed_intent, intent_details = parse_intent_response(raw_response, user_question)
     
     # =========================================================================
     # STEP 5: Return the parsed intent
@@ -177,9 +240,307 @@ def intent_agent(state: AnalystState) -> dict:
     #  display as a horizontal bar chart, sorted descending by revenue."
     #
     # This will be used by code_writer_agent to generate Python code.
+    # intent_details holds the same information as separate fields.
     # =========================================================================
     
-    return {"parsed_intent": parsed_intent}
+    return _store_intent(cache_key, parsed_intent, intent_details)
+
+
+async def aintent_agent(state: AnalystState) -> dict:
+    """
+    Async version of intent_agent().
+    
+    LangGraph uses this when the graph runs with ainvoke()/astream() (for
+    example under `langgraph dev` / LangGraph Studio). Inputs and outputs
+    are identical; the LLM request is awaited instead of blocking a thread.
+    """
+    
+    cache_key = _intent_cache_key(state["user_question"], state["dataframe_summary"])
+    cached = _lookup_intent(cache_key)
+    if cached is not None:
+        return cached
+    
+    llm = get_llm(
+        INTENT_MODEL,
+        temperature=0,
+        max_tokens=INTENT_MAX_TOKENS,
+        model_kwargs=structured_output_options(INTENT_RESPONSE_FORMAT)
+    )
+    
+    dataframe_summary = compact_summary(state["dataframe_summary"])
+    
+    messages = [
+        SystemMessage(content=INTENT_PARSER_SYSTEM_PROMPT),
+        HumanMessage(content=INTENT_PARSER_USER_PROMPT.format(
+            dataframe_summary=dataframe_summary,
+            user_question=state["user_question"]
+        ))
+    ]
+    
+    raw_response = await acached_invoke(
+        llm, messages, **prompt_cache_options(dataframe_summary)
+    )
+    
+    parsed_intent, intent_details = parse_intent_response(
+        raw_response, state["user_question"]
+    )
+    
+    return _store_intent(cache_key, parsed_intent, intent_details)
+
+
+# =============================================================================
+# INTENT CACHE
+# =============================================================================
+# Dashboards and demos ask the same handful of questions over and over.
+# The parsed intent only depends on the question and on which columns exist,
+# so we key the cache on:
+# - the question, lower-cased, with whitespace collapsed and trailing
+#   punctuation removed ("Top 5 products?" == "top 5 products")
+# - a fingerprint of the schema: sorted (column name, dtype) pairs. Row
+#   counts, null counts and sample values don't change the intent, so a
+#   refreshed sheet with the same columns still hits.
+#
+# Hits return in microseconds. Misses still go through cached_invoke(), which
+# adds the persistent exact-match cache from llm.py underneath.
+# =============================================================================
+
+# Maximum number of parsed intents kept in memory (least recently used evicted)
+INTENT_CACHE_SIZE = 256
+
+_intent_cache = OrderedDict()
+_intent_cache_lock = threading.Lock()
+
+
+def _intent_cache_key(user_question: str, dataframe_summary: str) -> str:
+    """Build the cache key for a (question, schema) pair."""
+    question = " ".join(user_question.lower().split()).rstrip("?.! ")
+    schema = sorted(summary_columns(dataframe_summary))
+    # Summaries not in schema_agent's format are fingerprinted as a whole
+    fingerprint = repr(schema) if schema else dataframe_summary
+    
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(f"{question}\x00{fingerprint}".encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def _lookup_intent(key: str):
+    """Return a copy of the cached state update for key, or None."""
+    with _intent_cache_lock:
+        if key not in _intent_cache:
+            return None
+        _intent_cache.move_to_end(key)
+        parsed_intent, intent_details = _intent_cache[key]
+    return {"parsed_intent": parsed_intent, "intent_details": dict(intent_details)}
+
+
+def _store_intent(key: str, parsed_intent: str, intent_details: dict) -> dict:
+    """Cache a parsed intent and return it as a state update."""
+    with _intent_cache_lock:
+        _intent_cache[key] = (parsed_intent, dict(intent_details))
+        _intent_cache.move_to_end(key)
+        while len(_intent_cache) > INTENT_CACHE_SIZE:
+            _intent_cache.popitem(last=False)
+    return {"parsed_intent": parsed_intent, "intent_details": intent_details}
+
+
+# Limits for the schema text sent to the intent parser (see compact_summary)
+INTENT_SUMMARY_MAX_COLUMNS = 50
+INTENT_SUMMARY_MAX_CHARS = 2000
+
+# "Total Rows: N" line from schema_agent (columns come from summary_columns())
+_TOTAL_ROWS_RE = re.compile(r"^Total Rows: .*$", re.MULTILINE)
+
+
+def compact_summary(
+    dataframe_summary: str,
+    max_columns: int = INTENT_SUMMARY_MAX_COLUMNS,
+    max_chars: int = INTENT_SUMMARY_MAX_CHARS
+) -> str:
+    """
+    Shrink schema_agent's summary to what intent parsing needs.
+    
+    Rewriting the question only requires knowing which columns exist and
+    their types. Null counts and sample rows are dropped (code_writer_agent
+    still gets the full summary), and very wide tables are cut off after
+    max_columns so the prompt stays small.
+    
+    Parameters:
+    -----------
+    dataframe_summary : str
+        The full summary from schema_agent
+    max_columns : int
+        Maximum number of columns to list
+    max_chars : int
+        Hard cap on the length of the result
+        
+    Returns:
+    --------
+    str
+        The compact summary (or the original text, truncated, if it isn't
+        in schema_agent's format)
+    """
+    
+    columns = summary_columns(dataframe_summary)
+    if not columns:
+        return dataframe_summary[:max_chars]
+    
+    lines = []
+    total_rows = _TOTAL_ROWS_RE.search(dataframe_summary)
+    if total_rows:
+        lines.append(total_rows.group(0))
+    
+    lines.append("Columns:")
+    lines.extend(f"  - {name}: {dtype}" for name, dtype in columns[:max_columns])
+    if len(columns) > max_columns:
+        lines.append(f"  ... ({len(columns) - max_columns} more columns)")
+    
+    return "\n".join(lines)[:max_chars]
+
+
+# Maximum number of intent requests in flight at once in intent_agent_batch()
+INTENT_BATCH_CONCURRENCY = 8
+
+
+def intent_agent_batch(states: List[AnalystState]) -> List[dict]:
+    """
+    Parse several questions with one batched LLM call.
+    
+    This is the batch form of intent_agent() for callers that have many
+    independent questions at once (an evaluation run, a dashboard with
+    several panels). Each state gets the same prompt it would get on its
+    own, but the requests are sent concurrently with llm.batch() instead of
+    one round-trip after another.
+    
+    It uses the same caches as intent_agent(): questions already in the
+    intent cache are answered without a request, repeats within the batch
+    are sent once, and the rest go through cached_batch() (the exact-match
+    response cache from llm.py).
+    
+    Parameters:
+    -----------
+    states : List[AnalystState]
+        One state per question, each with "user_question" and
+        "dataframe_summary"
+        
+    Returns:
+    --------
+    List[dict]
+        One {"parsed_intent": ..., "intent_details": ...} update per input
+        state, in order
+    """
+    
+    llm = get_llm(
+        INTENT_MODEL,
+        temperature=0,
+        max_tokens=INTENT_MAX_TOKENS,
+        model_kwargs=structured_output_options(INTENT_RESPONSE_FORMAT)
+    )
+    
+    # Answer repeats from the intent cache; only the rest are sent, and
+    # questions that share a cache key within the batch are sent only once
+    keys = [
+        _intent_cache_key(state["user_question"], state["dataframe_summary"])
+        for state in states
+    ]
+    updates = [_lookup_intent(key) for key in keys]
+    first_index = {}
+    for i, update in enumerate(updates):
+        if update is None:
+            first_index.setdefault(keys[i], i)
+    pending = list(first_index.values())
+    
+    message_lists = [
+        [
+            SystemMessage(content=INTENT_PARSER_SYSTEM_PROMPT),
+            HumanMessage(content=INTENT_PARSER_USER_PROMPT.format(
+                dataframe_summary=compact_summary(states[i]["dataframe_summary"]),
+                user_question=states[i]["user_question"]
+            ))
+        ]
+        for i in pending
+    ]
+    
+    if message_lists:
+        raw_responses = cached_batch(
+            llm, message_lists, max_concurrency=INTENT_BATCH_CONCURRENCY
+        )
+        fetched = {}
+        for i, raw_response in zip(pending, raw_responses):
+            parsed_intent, intent_details = parse_intent_response(
+                raw_response, states[i]["user_question"]
+            )
+            fetched[keys[i]] = _store_intent(keys[i], parsed_intent, intent_details)
+        # Each state gets its own copy of the details (duplicates included)
+        updates = [
+            update if update is not None else {
+                "parsed_intent": fetched[key]["parsed_intent"],
+                "intent_details": dict(fetched[key]["intent_details"])
+            }
+            for key, update in zip(keys, updates)
+        ]
+    
+    return updates
+
+
+# A reply wrapped in a markdown code block (```json ... ```), as backends
+# without response_format often send it
+_CODE_FENCE_RE = re.compile(r"^```[\w-]*[ \t]*\n?(.*?)\s*```$", re.DOTALL)
+
+# The "instruction" value at the start of a (possibly cut off) JSON response
+_INSTRUCTION_RE = re.compile(r'^\{\s*"instruction"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+def parse_intent_response(response_text: str, user_question: str = ""):
+    """
+    Split the LLM's JSON response into the instruction and its details.
+    
+    Backends that don't get a response_format may wrap the JSON in a
+    ```json code block (it is removed first) or answer with plain text.
+    Plain text is still a usable instruction, so in that case we return it
+    as-is with empty details instead of failing.
+    
+    A JSON object that doesn't parse was cut off at INTENT_MAX_TOKENS
+    (finish_reason == "length"). Half a JSON document is not a usable
+    instruction, so we fall back to the plain intent instead: the complete
+    "instruction" field if it made it into the response, otherwise the
+    user's own question.
+    
+    Parameters:
+    -----------
+    response_text : str
+        The raw LLM response
+    user_question : str
+        The question that was parsed (used for a cut-off response)
+        
+    Returns:
+    --------
+    tuple
+        (parsed_intent, intent_details) - the instruction string and a dict
+        with the remaining fields (or {} if the response wasn't JSON)
+    """
+    
+    text = response_text.strip()
+    fenced = _CODE_FENCE_RE.match(text)
+    if fenced:
+        text = fenced.group(1).strip()
+    
+    try:
+        data = orjson.loads(text)
+    except orjson.JSONDecodeError:
+        if not text.startswith("{"):
+            return text, {}
+        match = _INSTRUCTION_RE.match(text)
+        if match:
+            instruction = orjson.loads(f'"{match.group(1)}"').strip()
+            if instruction:
+                return instruction, {}
+        return user_question.strip() or text, {}
+    
+    if not isinstance(data, dict) or not data.get("instruction"):
+        return text, {}
+    
+    instruction = str(data.pop("instruction")).strip()
+    return instruction, data
 
 
 # =============================================================================
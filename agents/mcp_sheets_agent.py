@@ -85,26 +85,41 @@ We mitigate this by logging all tool calls for transparency.
 """
 
 import os
+import re
+import csv
+import time
+import asyncio
+import threading
+import orjson
 import pandas as pd
-from typing import Dict, Any, List
-from io import StringIO
-from dotenv import load_dotenv
+from typing import Dict, Any, List, Optional
+from io import BytesIO, StringIO
 
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain.agents import create_agent
 
 from state import AnalystState
+from llm import get_llm
 from sheets_mcp.sheets_client import get_sheets_tools
+from tools.dataframe_loader import read_csv, store_dataframe
 
-# Load environment variables from .env file
-load_dotenv()
+# Model used for the tool-calling loop (read once at import time)
+SHEETS_AGENT_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o")
 
-# Get configuration from environment variables
-# BASE_URL allows using alternative OpenAI-compatible APIs (e.g., Azure, local LLMs)
-# OPENAI_API_KEY is your authentication token for the API
-BASE_URL = os.getenv("BASE_URL", "https://api.openai.com/v1")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# How long a loaded MCP tool list is reused before asking the server again
+TOOLS_CACHE_TTL_SECONDS = 300
+
+# After a failed tool load, how long to report the same error before trying
+# the MCP server again (so an outage doesn't respawn it on every question)
+TOOLS_RETRY_SECONDS = 30
+
+# Cached tool list (and when it was loaded) plus compiled agents, keyed by
+# (model, tool names). Building either one is expensive: tool discovery talks
+# to the MCP server, and create_agent() compiles a graph and generates a JSON
+# schema for every tool.
+_tools_cache = {"tools": None, "loaded_at": 0.0, "error": None, "failed_at": 0.0}
+_agent_cache = {}
+_agent_cache_lock = threading.Lock()
 
 # Directory for temporary files
 TEMP_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "temp")
@@ -189,20 +204,162 @@ def mcp_sheets_agent(state: AnalystState) -> Dict[str, Any]:
             "Please enter a question about your data."
         )
     
+    tools = _load_tools()
+    
+    # Fast path: the question links a spreadsheet, so there's nothing to
+    # search for - read it directly without any LLM calls.
+    linked = _fetch_linked_sheet(user_question, tools)
+    if linked is not None:
+        return _save_agent_answer(*linked)
+    
+    agent = _create_sheets_agent(tools)
+    
+    # =========================================================================
+    # STEP 4: Run the agent with only the user's question
+    # =========================================================================
+    # We stream the agent with a single human message containing the question.
+    # The agent will autonomously decide which tools to call.
+    #
+    # WHY STREAM INSTEAD OF INVOKE?
+    # With stream_mode="values", each event is the full state after one step
+    # of the loop. We only look at the messages added since the last event,
+    # so every message is processed exactly once, as soon as it arrives -
+    # no second pass over the (potentially large) tool observations after
+    # the loop finishes.
+    # =========================================================================
+    
+    # Prepare the input message
+    input_messages = [HumanMessage(content=user_question)]
+    
+    mcp_tool_calls = []
+    final_message = None
+    seen = len(input_messages)
+    
+    try:
+        # Run the agent
+        # This starts the tool-calling loop and runs until the agent
+        # decides it has enough information to answer
+        for event in agent.stream({"messages": input_messages}, stream_mode="values"):
+            messages = event.get("messages", [])
+            answer = _record_messages(messages[seen:], mcp_tool_calls)
+            if answer is not None:
+                final_message = answer
+            seen = len(messages)
+        
+    except Exception as e:
+        raise RuntimeError(f"Agent execution failed: {str(e)}")
+    
+    return _save_agent_answer(final_message, mcp_tool_calls)
+
+
+async def amcp_sheets_agent(state: AnalystState) -> Dict[str, Any]:
+    """
+    Async version of mcp_sheets_agent().
+    
+    LangGraph uses this when the graph runs with ainvoke()/astream() (for
+    example under `langgraph dev` / LangGraph Studio). Inputs and outputs
+    are identical; the agent loop is awaited with astream(), so each LLM
+    request in the loop leaves the event loop free for other runs.
+    """
+    
+    user_question = state.get("user_question", "")
+    
+    if not user_question:
+        raise RuntimeError(
+            "No user question provided. "
+            "Please enter a question about your data."
+        )
+    
+    # Tool discovery and direct tool calls block on the MCP background loop,
+    # so keep them off ours
+    tools = await asyncio.to_thread(_load_tools)
+    
+    linked = await asyncio.to_thread(_fetch_linked_sheet, user_question, tools)
+    if linked is not None:
+        return _save_agent_answer(*linked)
+    
+    agent = _create_sheets_agent(tools)
+    
+    input_messages = [HumanMessage(content=user_question)]
+    
+    mcp_tool_calls = []
+    final_message = None
+    seen = len(input_messages)
+    
+    try:
+        async for event in agent.astream({"messages": input_messages}, stream_mode="values"):
+            messages = event.get("messages", [])
+            answer = _record_messages(messages[seen:], mcp_tool_calls)
+            if answer is not None:
+                final_message = answer
+            seen = len(messages)
+        
+    except Exception as e:
+        raise RuntimeError(f"Agent execution failed: {str(e)}")
+    
+    return _save_agent_answer(final_message, mcp_tool_calls)
+
+
+def _load_tools() -> List[Any]:
+    """
+    Return the MCP tools, reusing the list loaded in the last few minutes.
+    """
+    
     # =========================================================================
     # STEP 2: Load MCP tools from Smithery
     # =========================================================================
     # This connects to the Smithery MCP server and loads all available tools.
     # Each tool becomes callable by the LLM during the agent loop.
+    #
+    # The tool list rarely changes, so we reuse it for
+    # TOOLS_CACHE_TTL_SECONDS before asking the server again.
+    #
+    # With no tools the agent can't fetch anything, so we fail fast instead
+    # of paying for an LLM call that can't succeed. A failure is remembered
+    # for TOOLS_RETRY_SECONDS so repeated questions during an outage don't
+    # hammer the MCP server either.
     # =========================================================================
     
-    try:
-        tools = get_sheets_tools()
-    except RuntimeError as e:
-        raise RuntimeError(f"Failed to load MCP tools: {str(e)}")
+    with _agent_cache_lock:
+        now = time.monotonic()
+        tools = _tools_cache["tools"]
+        
+        if tools is not None and now - _tools_cache["loaded_at"] <= TOOLS_CACHE_TTL_SECONDS:
+            return tools
+        
+        if _tools_cache["error"] and now - _tools_cache["failed_at"] <= TOOLS_RETRY_SECONDS:
+            raise RuntimeError(_tools_cache["error"])
+        
+        try:
+            tools = get_sheets_tools()
+        except RuntimeError as e:
+            error = f"Failed to load MCP tools: {str(e)}"
+        else:
+            error = None if tools else (
+                "No MCP tools available. "
+                "Check that mcp-google-sheets is properly installed and configured."
+            )
+        
+        if error:
+            _tools_cache.update(tools=None, error=error, failed_at=now)
+            raise RuntimeError(error)
+        
+        _tools_cache.update(tools=tools, loaded_at=now, error=None)
+    
+    return tools
+
+
+def _create_sheets_agent(tools: List[Any]):
+    """
+    Build the ReAct agent around the shared LLM and the given tools.
+    
+    The compiled agent is cached, so repeat questions skip graph compilation.
     
-    # Log available tools for debugging
-    tool_names = [t.name for t in tools]
+    Returns:
+    --------
+    CompiledGraph
+        The agent, ready for stream()/astream() with {"messages": [...]}
+    """
     
     # =========================================================================
     # STEP 3: Create the ReAct agent
@@ -213,53 +370,187 @@ def mcp_sheets_agent(state: AnalystState) -> Dict[str, Any]:
     # - Handles tool execution and response parsing
     # =========================================================================
     
-    # Initialize the LLM with tool-calling capabilities
-    llm = ChatOpenAI(
-        base_url=BASE_URL,
-        api_key=OPENAI_API_KEY,
-        model=os.getenv("OPENAI_MODEL", "gpt-4o"),  # Using GPT-4o for best tool-calling performance
-        temperature=0    # Low temperature for consistent tool calls
+    # Get the shared LLM client with tool-calling capabilities.
+    # get_llm() hands back the same ChatOpenAI (and HTTP connection pool)
+    # every time, so the agent loop's many requests reuse open connections.
+    llm = get_llm(
+        SHEETS_AGENT_MODEL,  # Using GPT-4o for best tool-calling performance
+        temperature=0        # Low temperature for consistent tool calls
     )
     
     # Create the ReAct agent with MCP tools
-    # This binds the tools to the LLM and sets up the agent loop
-    agent = create_agent(
-        model=llm,
-        tools=tools,
-        system_prompt=DATA_RETRIEVAL_SYSTEM_PROMPT
-    )
+    # This binds the tools to the LLM and sets up the agent loop.
+    # The compiled agent only depends on the model and the tool set, so it
+    # is rebuilt only when one of them changes.
+    key = (SHEETS_AGENT_MODEL, tuple(t.name for t in tools))
     
-    # =========================================================================
-    # STEP 4: Run the agent with only the user's question
-    # =========================================================================
-    # We invoke the agent with a single human message containing the question.
-    # The agent will autonomously decide which tools to call.
-    # =========================================================================
+    with _agent_cache_lock:
+        if key not in _agent_cache:
+            _agent_cache[key] = create_agent(
+                model=llm,
+                tools=tools,
+                system_prompt=DATA_RETRIEVAL_SYSTEM_PROMPT
+            )
+        return _agent_cache[key]
+
+
+# =============================================================================
+# FAST PATH: QUESTIONS THAT LINK A SPREADSHEET
+# =============================================================================
+# "Analyze https://docs.google.com/spreadsheets/d/ABC123/edit" already tells
+# us which spreadsheet to use, so the search part of the ReAct loop (several
+# LLM + MCP round-trips) is wasted work. We call the read tool ourselves.
+#
+# This is best-effort: if the tools we need aren't there, or a result isn't
+# in a shape we recognize, we return None and the normal agent loop runs.
+# =============================================================================
+
+_SHEET_URL_RE = re.compile(r"/spreadsheets/d/([a-zA-Z0-9_-]+)")
+
+# Tools that read a sheet's values, in order of preference
+_READ_TOOL_NAMES = ("read_spreadsheet", "get_sheet_data")
+
+
+def _fetch_linked_sheet(user_question: str, tools: List[Any]):
+    """
+    Read the spreadsheet linked in the question directly, if there is one.
     
-    # Prepare the input message
-    input_messages = [HumanMessage(content=user_question)]
+    Parameters:
+    -----------
+    user_question : str
+        The user's question (may contain a Google Sheets URL)
+    tools : List[Any]
+        The loaded MCP tools
+        
+    Returns:
+    --------
+    tuple or None
+        (csv_text, mcp_tool_calls) ready for _save_agent_answer(), or None
+        if the agent loop should handle the question
+    """
+    
+    match = _SHEET_URL_RE.search(user_question)
+    if not match:
+        return None
+    
+    tools_by_name = {t.name: t for t in tools}
+    reader = next(
+        (tools_by_name[name] for name in _READ_TOOL_NAMES if name in tools_by_name),
+        None
+    )
+    if reader is None:
+        return None
+    
+    mcp_tool_calls = []
+    args = {"spreadsheet_id": match.group(1)}
     
     try:
-        # Run the agent
-        # This starts the tool-calling loop and runs until the agent
-        # decides it has enough information to answer
-        result = agent.invoke({"messages": input_messages})
+        # Readers that need a tab name get the first tab
+        if "sheet" in (reader.args or {}) and "list_sheets" in tools_by_name:
+            sheets = _call_logged(tools_by_name["list_sheets"], dict(args), mcp_tool_calls)
+            sheet_names = _json_value(sheets)
+            if not isinstance(sheet_names, list) or not sheet_names:
+                return None
+            first_sheet = sheet_names[0]
+            if isinstance(first_sheet, dict):
+                first_sheet = first_sheet.get("title", first_sheet.get("name"))
+            if not first_sheet:
+                return None
+            args["sheet"] = str(first_sheet)
         
-    except Exception as e:
-        raise RuntimeError(f"Agent execution failed: {str(e)}")
+        rows = _rows_from_result(_call_logged(reader, args, mcp_tool_calls))
+    except Exception:
+        return None
+    
+    if not rows:
+        return None
+    
+    buffer = StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue(), mcp_tool_calls
+
+
+def _call_logged(tool, args: dict, mcp_tool_calls: List[dict]):
+    """Invoke a tool and add it to the tool-call log like the agent loop does."""
+    result = tool.invoke(args)
+    mcp_tool_calls.append({
+        "tool": tool.name,
+        "args": args,
+        "result": _result_preview(result)
+    })
+    return result
+
+
+def _json_value(result):
+    """Decode a tool result (JSON text or text content blocks), or None."""
+    if isinstance(result, list) and all(isinstance(b, (dict, str)) for b in result):
+        result = "".join(b.get("text", "") if isinstance(b, dict) else b for b in result)
+    if not isinstance(result, str):
+        return result
+    try:
+        return orjson.loads(result)
+    except orjson.JSONDecodeError:
+        return None
+
+
+def _rows_from_result(result) -> Optional[List[list]]:
+    """
+    Turn a read tool's result into rows (header row first), or None.
     
-    # =========================================================================
-    # STEP 5: Extract tool calls for logging
-    # =========================================================================
-    # We log which tools the agent called so we can display this in the UI.
-    # This is crucial for explainability - users can see the agent's reasoning.
-    # =========================================================================
+    Accepts a list of rows, a list of records (dicts), or an object with the
+    rows under "values" / "data" / "rows".
+    """
     
-    mcp_tool_calls = []
+    data = _json_value(result)
+    
+    if isinstance(data, dict):
+        data = next(
+            (data[key] for key in ("values", "data", "rows") if key in data),
+            None
+        )
+    
+    if not isinstance(data, list) or not data:
+        return None
+    
+    if all(isinstance(row, list) for row in data):
+        return data
+    
+    if all(isinstance(row, dict) for row in data):
+        header = list(data[0].keys())
+        return [header] + [[row.get(column, "") for column in header] for row in data]
+    
+    return None
+
+
+def _record_messages(messages: List[Any], mcp_tool_calls: List[dict]):
+    """
+    Log tool activity from newly arrived agent messages.
+    
+    Parameters:
+    -----------
+    messages : List[BaseMessage]
+        Messages added to the conversation since the previous stream event
+    mcp_tool_calls : List[dict]
+        The tool-call log, appended to in place
+        
+    Returns:
+    --------
+    str or None
+        The content of the last final answer among these messages, if any
+    """
+    
+    answer = None
     
-    for message in result.get("messages", []):
-        # Check if this message contains tool calls
-        if hasattr(message, "tool_calls") and message.tool_calls:
+    for message in messages:
+        # =====================================================================
+        # STEP 5: Record tool calls for logging
+        # =====================================================================
+        # We log which tools the agent called so we can display this in the
+        # UI. This is crucial for explainability - users can see the agent's
+        # reasoning.
+        # =====================================================================
+        
+        if getattr(message, "tool_calls", None):
             for tool_call in message.tool_calls:
                 mcp_tool_calls.append({
                     "tool": tool_call.get("name", "unknown"),
@@ -267,33 +558,78 @@ def mcp_sheets_agent(state: AnalystState) -> Dict[str, Any]:
                 })
         
         # Also capture tool response messages
-        if hasattr(message, "type") and message.type == "tool":
+        elif message.type == "tool":
             # Find the corresponding tool call to update with result
             if mcp_tool_calls and "result" not in mcp_tool_calls[-1]:
                 # Truncate long results for display
-                content = str(message.content)
-                if len(content) > 200:
-                    content = content[:200] + "..."
-                mcp_tool_calls[-1]["result"] = content
+                mcp_tool_calls[-1]["result"] = _result_preview(message.content)
+        
+        # =====================================================================
+        # STEP 6: Keep the latest answer (CSV data)
+        # =====================================================================
+        # An AI message without tool calls is the agent's answer.
+        # The last one wins - it should contain the CSV data.
+        # =====================================================================
+        
+        elif message.type == "ai":
+            answer = message.content
     
-    # =========================================================================
-    # STEP 6: Extract the final answer (CSV data)
-    # =========================================================================
-    # The last message from the agent should contain the CSV data.
-    # We parse it and save it to a temp file.
-    # =========================================================================
+    return answer
+
+
+# Number of characters of each tool result kept for the UI log
+TOOL_RESULT_PREVIEW_CHARS = 200
+
+
+def _result_preview(content, limit: int = TOOL_RESULT_PREVIEW_CHARS) -> str:
+    """
+    Return the first `limit` characters of a tool result for display.
     
-    # Get the last AI message (the final answer)
-    final_message = None
-    for message in reversed(result.get("messages", [])):
-        if hasattr(message, "type") and message.type == "ai":
-            final_message = message.content
-            break
-        elif hasattr(message, "content") and not hasattr(message, "tool_calls"):
-            # AIMessage without tool_calls is a final answer
-            if not (hasattr(message, "tool_calls") and message.tool_calls):
-                final_message = message.content
+    Tool observations can be large (a whole sheet as JSON). We only ever
+    show a short preview, so we take it without converting everything to
+    one big string first:
+    - plain string content is sliced directly
+    - content blocks (a list) are read only until we have enough text
+    
+    The preview stays a plain str so the state remains serializable.
+    """
+    
+    if isinstance(content, str):
+        text = content[:limit + 1]
+    else:
+        parts = []
+        length = 0
+        for block in content if isinstance(content, list) else [content]:
+            if isinstance(block, dict):
+                block = block.get("text", block)
+            part = str(block)[:limit + 1 - length]
+            parts.append(part)
+            length += len(part)
+            if length > limit:
                 break
+        text = "".join(parts)
+    
+    if len(text) > limit:
+        text = text[:limit] + "..."
+    return text
+
+
+def _save_agent_answer(final_message, mcp_tool_calls: List[dict]) -> Dict[str, Any]:
+    """
+    Parse the agent's final answer as CSV, save it, and build the state update.
+    
+    Parameters:
+    -----------
+    final_message : str or None
+        The agent's final answer (should be CSV text)
+    mcp_tool_calls : List[dict]
+        The tool-call log, included in the state update
+        
+    Returns:
+    --------
+    dict
+        State updates containing csv_path, sheet_metadata, and mcp_tool_calls
+    """
     
     if not final_message:
         raise RuntimeError(
@@ -306,6 +642,9 @@ def mcp_sheets_agent(state: AnalystState) -> Dict[str, Any]:
     # =========================================================================
     # The agent should return CSV-formatted data. We parse it into a DataFrame
     # and save it so downstream agents can use it exactly as before.
+    #
+    # read_csv() parses straight from the in-memory bytes, using pyarrow's
+    # multi-threaded parser when it's installed.
     # =========================================================================
     
     try:
@@ -313,12 +652,16 @@ def mcp_sheets_agent(state: AnalystState) -> Dict[str, Any]:
         # Clean up the response - remove any markdown code fences if present
         csv_data = final_message.strip()
         if csv_data.startswith("```"):
-            # Remove markdown code fences
-            lines = csv_data.split("\n")
-            csv_data = "\n".join(lines[1:-1] if lines[-1] == "```" else lines[1:])
+            # Remove markdown code fences by slicing between the end of the
+            # opening fence line and the closing fence. Splitting into lines
+            # and re-joining would copy the whole (possibly large) payload twice.
+            start = csv_data.find("\n") + 1
+            end = csv_data.rfind("```")
+            csv_data = csv_data[start:end if end >= start else None].strip()
         
         # Parse CSV string into DataFrame
-        df = pd.read_csv(StringIO(csv_data))
+        csv_bytes = csv_data.encode("utf-8")
+        df = read_csv(BytesIO(csv_bytes))
         
     except Exception as e:
         # If parsing fails, the agent might have returned an error message
@@ -334,7 +677,16 @@ def mcp_sheets_agent(state: AnalystState) -> Dict[str, Any]:
     csv_path = os.path.join(TEMP_DIR, "fetched_sheet.csv")
     
     if not df.empty:
-        df.to_csv(csv_path, index=False, encoding="utf-8")
+        # The text parsed cleanly, so it already IS the CSV file we want.
+        # Writing the original bytes skips a full df.to_csv() serialization
+        # (the slowest step here on large sheets) and re-reading the file
+        # gives exactly the frame we parsed above.
+        with open(csv_path, "wb") as f:
+            f.write(csv_bytes)
+        
+        # Hand the parsed frame to the shared loader so schema_agent and
+        # executor_agent don't parse the file we just wrote all over again
+        store_dataframe(csv_path, df)
         
         # Build metadata string
         sheet_metadata = (
@@ -54,20 +54,24 @@ The narrative is actionable and understandable without technical background.
 """
 
 import os
-from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage
+from typing import List
+from langchain_core.messages import HumanMessage, SystemMessage
 from state import AnalystState
-from prompts.prompts import NARRATIVE_PROMPT
+from llm import get_llm
+from prompts.prompts import NARRATIVE_SYSTEM_PROMPT, NARRATIVE_USER_PROMPT
+from tools.python_executor import NO_TEXT_RESULT
 
-# Load environment variables from .env file
-load_dotenv()
+# Model used for the narrative. Defaults to OPENAI_MODEL so existing .env
+# files keep working; set NARRATIVE_MODEL to override.
+NARRATIVE_MODEL = os.getenv("NARRATIVE_MODEL", os.getenv("OPENAI_MODEL", "gpt-4o"))
 
-# Get configuration from environment variables
-# BASE_URL allows using alternative OpenAI-compatible APIs (e.g., Azure, local LLMs)
-# OPENAI_API_KEY is your authentication token for the API
-BASE_URL = os.getenv("BASE_URL", "https://api.openai.com/v1")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Upper bound on response length. The prompt asks for 3-5 sentences (~150
+# tokens); the cap only stops an unusually verbose answer from streaming for
+# many seconds, since generation time grows with every output token.
+NARRATIVE_MAX_TOKENS = 250
+
+# Seconds to wait on the API before giving up (and retrying)
+NARRATIVE_TIMEOUT_SECONDS = 20
 
 
 def narrative_agent(state: AnalystState) -> dict:
@@ -105,15 +109,24 @@ def narrative_agent(state: AnalystState) -> dict:
     # We gather three pieces of information:
     # - user_question: So we can reference what was originally asked
     # - parsed_intent: So we know what analysis approach was taken
+    #   (read straight from the state when the prompt is built in STEP 3)
     # - execution_result: The actual findings to explain
     #
     # All three contribute to a well-rounded narrative.
     # =========================================================================
     
     user_question = state["user_question"]
-    parsed_intent = state["parsed_intent"]
     execution_result = state["execution_result"]
     
+    # Empty results, failed executions and chart-only answers get a fixed
+    # explanation: there is nothing for an LLM to interpret, so we don't pay
+    # for a call.
+    quick_result = quick_narrative(
+        user_question, execution_result, state.get("chart_json")
+    )
+    if quick_result is not None:
+        return {"narrative": quick_result}
+    
     # =========================================================================
     # STEP 2: Initialize the LLM client
     # =========================================================================
@@ -125,40 +138,60 @@ def narrative_agent(state: AnalystState) -> dict:
     # - A little creativity makes the text feel less robotic
     #
     # Still, we keep it low enough to avoid hallucinating facts.
+    #
+    # get_llm() returns a client shared across calls (and agents), so we
+    # reuse its HTTP connection pool instead of opening a new one each time.
     # =========================================================================
     
-    llm = ChatOpenAI(
-        base_url=BASE_URL,
-        api_key=OPENAI_API_KEY,
-        model=os.getenv("OPENAI_MODEL", "gpt-4o"),
-        temperature=0.3  # Slightly creative for natural-sounding text
+    llm = get_llm(
+        NARRATIVE_MODEL,
+        temperature=0.3,  # Slightly creative for natural-sounding text
+        streaming=True,   # Send tokens as they are generated (see STEP 4)
+        max_tokens=NARRATIVE_MAX_TOKENS,
+        timeout=NARRATIVE_TIMEOUT_SECONDS
     )
     
     # =========================================================================
     # STEP 3: Build the prompt
     # =========================================================================
-    # The NARRATIVE_PROMPT template instructs the LLM to:
+    # The NARRATIVE_SYSTEM_PROMPT instructs the LLM to:
     # - Write in plain English (no jargon)
     # - Keep it to 3-5 sentences (concise but complete)
     # - Include specific numbers from the results
     # - Avoid bullet points (conversational flow)
     # - Focus on insights, not just numbers
     #
-    # We inject all three context pieces into the template.
+    # We inject all three context pieces into NARRATIVE_USER_PROMPT, which
+    # is sent AFTER the static system prompt. Every narrative request then
+    # starts with the same prefix, which the provider can serve from its
+    # prompt cache instead of processing it again.
+    #
+    # The result is clipped first (see clip_result): a 500-row table printed
+    # by the generated code would otherwise become thousands of prompt
+    # tokens, while a 3-5 sentence explanation only needs the top of it.
+    #
+    # _narrative_messages() builds these messages for every path (sync,
+    # async and batch), so the three can't drift apart.
     # =========================================================================
     
-    prompt = NARRATIVE_PROMPT.format(
-        user_question=user_question,
-        parsed_intent=parsed_intent,
-        execution_result=execution_result
-    )
+    messages = _narrative_messages(state)
     
     # =========================================================================
     # STEP 4: Call the LLM to generate narrative
     # =========================================================================
+    # We stream the response instead of waiting for the whole completion.
+    # When the graph runs with graph.stream(stream_mode="messages"), LangGraph
+    # forwards each of these chunks to the caller as it arrives, so the
+    # Streamlit app can show the narrative being written (see app.py) rather
+    # than a spinner for the full generation time.
+    #
+    # The node still returns the complete text, so downstream agents (and
+    # graph.invoke() callers) see exactly the same state as before.
+    # =========================================================================
     
-    response = llm.invoke([HumanMessage(content=prompt)])
-    narrative = response.content
+    narrative = "".join(
+        chunk.content for chunk in llm.stream(messages)
+    )
     
     # =========================================================================
     # STEP 5: Return the narrative
@@ -177,6 +210,206 @@ def narrative_agent(state: AnalystState) -> dict:
     return {"narrative": narrative}
 
 
+async def anarrative_agent(state: AnalystState) -> dict:
+    """
+    Async version of narrative_agent().
+    
+    LangGraph uses this when the graph runs with ainvoke()/astream() (for
+    example under `langgraph dev` / LangGraph Studio). Inputs and outputs
+    are identical; the tokens are awaited with astream() instead of
+    blocking a thread, and are still forwarded to "messages" streams.
+    """
+    
+    quick_result = quick_narrative(
+        state["user_question"], state["execution_result"], state.get("chart_json")
+    )
+    if quick_result is not None:
+        return {"narrative": quick_result}
+    
+    llm = get_llm(
+        NARRATIVE_MODEL,
+        temperature=0.3,
+        streaming=True,
+        max_tokens=NARRATIVE_MAX_TOKENS,
+        timeout=NARRATIVE_TIMEOUT_SECONDS
+    )
+    
+    chunks = []
+    async for chunk in llm.astream(_narrative_messages(state)):
+        chunks.append(chunk.content)
+    
+    return {"narrative": "".join(chunks)}
+
+
+# Maximum number of narrative requests in flight at once in narrative_agent_batch()
+NARRATIVE_BATCH_CONCURRENCY = 8
+
+
+def narrative_agent_batch(states: List[AnalystState]) -> List[dict]:
+    """
+    Write the narratives for several analyses with one batched LLM call.
+    
+    This is the batch form of narrative_agent() for callers that have many
+    finished analyses at once (an evaluation run, a dashboard with several
+    panels). Each state gets the same prompt it would get on its own, but
+    the requests are sent concurrently with llm.batch() instead of one
+    round-trip after another.
+    
+    Parameters:
+    -----------
+    states : List[AnalystState]
+        One state per analysis, each with "user_question", "parsed_intent"
+        and "execution_result"
+        
+    Returns:
+    --------
+    List[dict]
+        One {"narrative": ...} update per input state, in order
+    """
+    
+    llm = get_llm(
+        NARRATIVE_MODEL,
+        temperature=0.3,
+        streaming=True,
+        max_tokens=NARRATIVE_MAX_TOKENS,
+        timeout=NARRATIVE_TIMEOUT_SECONDS
+    )
+    
+    # Empty / failed results are answered without the LLM; only the rest are sent
+    updates = [
+        quick_narrative(
+            state["user_question"], state["execution_result"], state.get("chart_json")
+        )
+        for state in states
+    ]
+    pending = [i for i, narrative in enumerate(updates) if narrative is None]
+    
+    if pending:
+        responses = llm.batch(
+            [_narrative_messages(states[i]) for i in pending],
+            config={"max_concurrency": NARRATIVE_BATCH_CONCURRENCY}
+        )
+        for i, response in zip(pending, responses):
+            updates[i] = response.content
+    
+    return [{"narrative": narrative} for narrative in updates]
+
+
+def quick_narrative(user_question: str, execution_result: str, chart_json: str = None):
+    """
+    Return a fixed narrative when the result leaves nothing to explain.
+    
+    Three cases don't need an LLM: the code produced no output at all, it
+    failed (executor_agent reports failures as "Error executing code: ..."),
+    or it only drew a chart. In the last case the LLM would only see the
+    executor's placeholder text, not the chart, so all it could write is a
+    generic pointer to the chart - which a template does just as well.
+    The placeholder is also used when the code set neither `fig` nor
+    `result_text`, so the chart text is only used when chart_json is set;
+    without a chart the answer is treated as empty.
+    A template is faster, free, and (unlike an LLM given an error message)
+    never dresses a failure up as a finding. Everything else returns None so
+    the LLM writes the narrative.
+    
+    Parameters:
+    -----------
+    user_question : str
+        What the user originally asked
+    execution_result : str
+        The text output (or error message) from executor_agent
+    chart_json : str
+        The chart from executor_agent (None when no chart was drawn)
+        
+    Returns:
+    --------
+    str or None
+        The canned narrative, or None to use the LLM
+    """
+    
+    result = (execution_result or "").strip()
+    
+    # The "chart only" placeholder without a chart means nothing was produced
+    if result == NO_TEXT_RESULT and not chart_json:
+        result = ""
+    
+    if not result:
+        return (
+            "The analysis ran but returned no results. This usually means the "
+            "filter conditions matched no rows - try broadening your question."
+        )
+    
+    if result.startswith("Error executing code"):
+        return (
+            f"I wasn't able to answer \"{user_question.strip()}\" because the "
+            "analysis code failed while running. Try rephrasing the question, "
+            "for example by naming the columns you are interested in. The "
+            "technical details show the exact error."
+        )
+    
+    if result == NO_TEXT_RESULT:
+        return (
+            "The chart above shows the result. The analysis didn't produce a "
+            "text summary, so hover over the chart to see the exact values."
+        )
+    
+    return None
+
+
+def _narrative_messages(state: AnalystState) -> list:
+    """Build the narrative prompt messages for one state (see STEP 3 above)."""
+    return [
+        SystemMessage(content=NARRATIVE_SYSTEM_PROMPT),
+        HumanMessage(content=NARRATIVE_USER_PROMPT.format(
+            user_question=state["user_question"],
+            parsed_intent=state["parsed_intent"],
+            execution_result=clip_result(state["execution_result"])
+        ))
+    ]
+
+
+# Limits for the execution result sent to the narrative prompt
+NARRATIVE_RESULT_MAX_LINES = 40
+NARRATIVE_RESULT_MAX_CHARS = 4000
+
+
+def clip_result(
+    execution_result: str,
+    max_lines: int = NARRATIVE_RESULT_MAX_LINES,
+    max_chars: int = NARRATIVE_RESULT_MAX_CHARS
+) -> str:
+    """
+    Keep the start of a long execution result for the narrative prompt.
+    
+    The narrative is only a few sentences, so it never needs more than the
+    first rows of a printed table. Long results are cut after max_lines
+    lines / max_chars characters, and a marker tells the LLM how much was
+    left out so it doesn't describe the clipped part as the whole result.
+    
+    Parameters:
+    -----------
+    execution_result : str
+        The captured output from executor_agent
+    max_lines : int
+        Maximum number of lines to keep
+    max_chars : int
+        Maximum number of characters to keep
+        
+    Returns:
+    --------
+    str
+        The result unchanged if it fits, otherwise its start plus a
+        "[truncated ...]" marker
+    """
+    
+    lines = execution_result.splitlines()
+    if len(lines) <= max_lines and len(execution_result) <= max_chars:
+        return execution_result
+    
+    kept = "\n".join(lines[:max_lines])[:max_chars]
+    omitted = len(execution_result) - len(kept)
+    return f"{kept}\n... [truncated: {omitted} more characters not shown]"
+
+
 # =============================================================================
 # WHY NARRATIVE GENERATION MATTERS
 # =============================================================================
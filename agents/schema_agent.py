@@ -43,8 +43,70 @@ This gives downstream agents everything they need to write correct code.
 =============================================================================
 """
 
-import pandas as pd
+import os
+import re
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Tuple
+
 from state import AnalystState
+from tools.dataframe_loader import load_dataframe
+
+# =============================================================================
+# SUMMARY CACHE
+# =============================================================================
+# Users usually ask several questions about the same data. The summary only
+# depends on the file's contents, so we remember it per file and skip pandas
+# entirely on repeat questions.
+#
+# The key combines the file's size, modification time, and a hash of its
+# first 64 KB. Size + mtime catch almost every rewrite; the hash covers the
+# rare case of a same-size rewrite within the filesystem's mtime resolution.
+# =============================================================================
+
+# Maximum number of summaries kept (least recently used evicted)
+SCHEMA_CACHE_SIZE = 32
+
+# Bytes from the start of the file included in the cache key
+_HEAD_HASH_BYTES = 64 * 1024
+
+_schema_cache = OrderedDict()
+_schema_cache_lock = threading.Lock()
+
+
+# =============================================================================
+# SAMPLE SIZE LIMITS
+# =============================================================================
+# The summary is pasted into code_writer_agent's prompt on every question,
+# so its size is paid for in prompt tokens (and prefill time) every time.
+# Column names and types are always listed in full - the generated code
+# needs them. The sample rows, though, are only there to show what values
+# look like, so we bound them: wide sheets show their first columns only,
+# and long text cells (descriptions, notes, URLs) are clipped.
+# =============================================================================
+
+# Maximum number of columns shown in the sample rows
+SAMPLE_MAX_COLUMNS = 30
+
+# Text cells longer than this are clipped in the sample rows
+SAMPLE_CELL_MAX_CHARS = 40
+
+
+def _clip_cell(value):
+    """Shorten long text values for the sample rows (other values unchanged)."""
+    if isinstance(value, str) and len(value) > SAMPLE_CELL_MAX_CHARS:
+        return value[:SAMPLE_CELL_MAX_CHARS] + "..."
+    return value
+
+
+def _file_cache_key(csv_path: str) -> str:
+    """Build a cache key that changes whenever the file's contents change."""
+    stat = os.stat(csv_path)
+    with open(csv_path, "rb") as f:
+        head_hash = hashlib.blake2b(f.read(_HEAD_HASH_BYTES), digest_size=16).hexdigest()
+    return f"{os.path.abspath(csv_path)}:{stat.st_size}:{stat.st_mtime_ns}:{head_hash}"
 
 
 def schema_agent(state: AnalystState) -> dict:
@@ -82,15 +144,30 @@ def schema_agent(state: AnalystState) -> dict:
     
     csv_path = state["csv_path"]
     
+    # Same file contents as a previous question? Reuse its summary.
+    cache_key = _file_cache_key(csv_path)
+    with _schema_cache_lock:
+        if cache_key in _schema_cache:
+            _schema_cache.move_to_end(cache_key)
+            return {"dataframe_summary": _schema_cache[cache_key]}
+    
     # =========================================================================
     # STEP 2: Load the CSV file into a pandas DataFrame
     # =========================================================================
     # pd.read_csv() is the standard way to load CSV files in Python.
     # It automatically infers column types (numbers, strings, dates, etc.)
     # which we'll report in our summary.
+    #
+    # We go through load_dataframe() instead of calling pd.read_csv()
+    # ourselves. mcp_sheets_agent has usually registered the frame it just
+    # parsed, so this is a lookup rather than another full parse, and the
+    # executor later gets the very same frame (so the dtypes we report are
+    # exactly the ones the generated code will see).
+    #
+    # We only read from the shared frame here, so no .copy() is needed.
     # =========================================================================
     
-    dataframe = pd.read_csv(csv_path)
+    dataframe = load_dataframe(csv_path)
     
     # =========================================================================
     # STEP 3: Extract basic dataset information
@@ -110,12 +187,13 @@ def schema_agent(state: AnalystState) -> dict:
     column_names = dataframe.columns.tolist()
     
     # Get data types for each column
-    # This returns a Series with column names as index and dtypes as values
-    data_types = dataframe.dtypes
+    # dtypes is a Series (column name -> dtype); we convert it to a plain
+    # dict once, because looking up a dict key is much cheaper than indexing
+    # a Series by label, and we do one lookup per column below.
+    data_types = dataframe.dtypes.to_dict()
     
-    # Count null values in each column
-    # This returns a Series with column names as index and null counts as values
-    null_counts = dataframe.isnull().sum()
+    # Count null values in each column (also as a plain dict)
+    null_counts = dataframe.isnull().sum().to_dict()
     
     # =========================================================================
     # STEP 4: Get sample rows from the dataset
@@ -127,9 +205,31 @@ def schema_agent(state: AnalystState) -> dict:
     # - Numeric ranges (millions vs decimals)
     #
     # We limit to 3 rows to keep the summary concise while still informative.
+    #
+    # The rows are written as CSV rather than with to_string(). to_string()
+    # pads every cell to its column's width, which costs formatting time and
+    # (on wide sheets) lots of prompt tokens for nothing but spaces. LLMs
+    # read CSV just as well, and it's the format the data came in.
+    #
+    # Only the first SAMPLE_MAX_COLUMNS columns are shown, and long text
+    # cells are clipped (see SAMPLE SIZE LIMITS above).
     # =========================================================================
     
-    sample_rows = dataframe.head(3).to_string()
+    sample = dataframe.iloc[:3, :SAMPLE_MAX_COLUMNS]
+    # Positions rather than names, so duplicate column names are fine too
+    text_positions = [
+        position for position, dtype in enumerate(sample.dtypes)
+        if dtype == object or str(dtype).startswith("string")
+    ]
+    if text_positions:
+        # iloc can return a view; copy before replacing the cells
+        sample = sample.copy()
+        for position in text_positions:
+            sample.iloc[:, position] = sample.iloc[:, position].map(_clip_cell)
+    
+    sample_rows = sample.to_csv(index=False).rstrip()
+    if num_columns > SAMPLE_MAX_COLUMNS:
+        sample_rows += f"\n(first {SAMPLE_MAX_COLUMNS} of {num_columns} columns shown)"
     
     # =========================================================================
     # STEP 5: Build the column information section
@@ -144,13 +244,10 @@ def schema_agent(state: AnalystState) -> dict:
     # its mean without converting it first.
     # =========================================================================
     
-    column_info_lines = []
-    for column_name in column_names:
-        dtype = data_types[column_name]
-        nulls = null_counts[column_name]
-        column_info_lines.append(f"  - {column_name}: {dtype} ({nulls} nulls)")
-    
-    column_info_text = "\n".join(column_info_lines)
+    column_info_text = "\n".join(
+        f"  - {column_name}: {data_types[column_name]} ({null_counts[column_name]} nulls)"
+        for column_name in column_names
+    )
     
     # =========================================================================
     # STEP 6: Compose the final summary
@@ -162,7 +259,7 @@ def schema_agent(state: AnalystState) -> dict:
     # FORMAT CHOICES:
     # - Clear section headers (DATASET OVERVIEW, COLUMNS, SAMPLE DATA)
     # - Bullet points for column details
-    # - Actual data samples in a table format
+    # - Actual data samples as CSV rows (header + 3 rows)
     # =========================================================================
     
     summary = f"""DATASET OVERVIEW:
@@ -189,9 +286,45 @@ SAMPLE DATA (First 3 Rows):
     # This summary will be available to all subsequent agents in the pipeline.
     # =========================================================================
     
+    with _schema_cache_lock:
+        _schema_cache[cache_key] = summary
+        _schema_cache.move_to_end(cache_key)
+        while len(_schema_cache) > SCHEMA_CACHE_SIZE:
+            _schema_cache.popitem(last=False)
+    
     return {"dataframe_summary": summary}
 
 
+async def aschema_agent(state: AnalystState) -> dict:
+    """
+    Async version of schema_agent().
+    
+    LangGraph uses this when the graph runs with ainvoke()/astream(). The
+    work itself is the same, but all of it blocks: hashing the file for the
+    cache key, waiting for (or doing) the CSV parse, and the pandas
+    reductions. So we run schema_agent() in a worker thread and keep the
+    event loop free for other requests' LLM calls in the meantime.
+    """
+    
+    return await asyncio.to_thread(schema_agent, state)
+
+
+# "  - column_name: dtype (N nulls)" lines written in STEP 5 of schema_agent()
+_SUMMARY_COLUMN_RE = re.compile(r"^  - (.+): (\S+) \(\d+ nulls\)$", re.MULTILINE)
+
+
+def summary_columns(dataframe_summary: str) -> List[Tuple[str, str]]:
+    """
+    Read the (column name, dtype) pairs back out of a schema summary.
+    
+    Downstream agents that need the column list (intent_agent's cache key
+    and compact schema, code_writer_agent's templates) use this instead of
+    their own regex, so the parsing stays in step with the format above.
+    Returns [] for text that isn't in this module's format.
+    """
+    return _SUMMARY_COLUMN_RE.findall(dataframe_summary)
+
+
 # =============================================================================
 # DESIGN NOTES
 # =============================================================================
@@ -214,6 +347,10 @@ SAMPLE DATA (First 3 Rows):
 # 2. Use chunked reading with pd.read_csv(chunksize=...)
 # 3. Sample the data randomly instead of taking head()
 #
+# Note that the executor needs the full DataFrame anyway, and it shares the
+# one loaded here (tools/dataframe_loader.py), so a separate chunked pass
+# just for the summary would mean parsing the file twice.
+#
 # For this learning project, we assume reasonable file sizes.
 #
 # =============================================================================
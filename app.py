@@ -47,12 +47,35 @@ EXECUTION FLOW:
 =============================================================================
 """
 
+import gc
+import re
+import time
+import base64
+import hashlib
 import streamlit as st
-import pandas as pd
-import plotly.io as pio
-import tempfile
-import os
-from graph import build_graph
+import orjson
+
+# NOTE: plotly and graph (which pulls in LangChain, LangGraph and the
+# OpenAI client) are imported where they are first used, below. Importing
+# them here would make the page wait for several seconds of imports before
+# anything is drawn, even though neither is needed until "Analyze" is clicked.
+# Python caches modules after the first import, so later runs pay nothing.
+
+# =============================================================================
+# GARBAGE COLLECTOR TUNING
+# =============================================================================
+# Python's cyclic garbage collector runs a pass every 700 net allocations of
+# container objects by default. A pipeline run creates hundreds of thousands
+# of them (LangChain messages, pandas metadata, Plotly figure dicts), so the
+# collector keeps walking a heap that is mostly long-lived modules.
+#
+# Almost all of that memory is freed by reference counting anyway; only
+# reference cycles need the collector. Raising the first threshold makes it
+# run far less often without letting cycles pile up. gc.set_threshold() is
+# idempotent, so re-running it on every Streamlit rerun is harmless.
+# =============================================================================
+
+gc.set_threshold(50_000, 20, 20)
 
 # =============================================================================
 # PAGE CONFIGURATION
@@ -88,6 +111,182 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
+# =============================================================================
+# CACHED PIPELINE
+# =============================================================================
+# Streamlit re-runs this whole script on every interaction, so calling
+# build_graph() in the submit handler rebuilt and recompiled the LangGraph
+# pipeline on every click. @st.cache_resource keeps ONE compiled graph for
+# the whole server process (shared by all sessions) instead.
+#
+# This is safe because the compiled graph holds no per-request data: every
+# run gets its own state dict (initial_state below).
+# =============================================================================
+
+@st.cache_resource(show_spinner=False)
+def get_graph():
+    """Build the multi-agent pipeline once and reuse it across reruns."""
+    from graph import build_graph
+    return build_graph()
+
+
+# How long a finished run is reused for an identical repeat submission
+REPEAT_WINDOW_SECONDS = 120
+
+# The pipeline's nodes in execution order: node name -> (icon, display
+# name, what it does). Used for the progress display while the graph runs.
+PIPELINE_STEPS = {
+    "mcp_sheets_agent": ("🔌", "MCP Sheets Agent", "Searching for relevant data..."),
+    "schema_agent": ("🔍", "Schema Agent", "Reading dataset structure..."),
+    "intent_agent": ("🎯", "Intent Agent", "Understanding your question..."),
+    "code_writer_agent": ("💻", "Code Writer Agent", "Generating analysis code..."),
+    "executor_agent": ("⚙️", "Executor Agent", "Running the analysis..."),
+    "narrative_agent": ("📝", "Narrative Agent", "Creating explanation..."),
+    "critic_agent": ("✅", "Critic Agent", "Evaluating results..."),
+}
+
+# =============================================================================
+# LARGE CHARTS
+# =============================================================================
+# A scatter/line chart over a big sheet can carry hundreds of thousands of
+# points. The browser then spends seconds drawing (and the WebSocket seconds
+# sending) far more points than there are pixels. Above CHART_MAX_POINTS we
+# keep every Nth point of each scatter trace before displaying it - enough
+# to show the same shape, at a size the browser handles instantly.
+#
+# Plotly stores NumPy-backed arrays as typed arrays ({"dtype", "bdata"}:
+# base64-encoded raw bytes) in chart JSON, so both those and plain lists
+# are handled.
+# =============================================================================
+
+# Maximum number of scatter points sent to the browser
+CHART_MAX_POINTS = 50_000
+
+# Above this many points, scatter traces are drawn with WebGL (scattergl).
+# SVG draws every point as a DOM element and gets sluggish past ~15k;
+# WebGL draws them on the GPU.
+CHART_WEBGL_POINTS = 15_000
+
+# Per-point trace properties that must be thinned together with x/y
+_POINT_KEYS = ("x", "y", "text", "hovertext", "customdata", "ids")
+_MARKER_POINT_KEYS = ("color", "size", "symbol", "opacity")
+
+
+def _point_count(value) -> int:
+    """Number of points in a plain list or a Plotly typed array."""
+    if isinstance(value, list):
+        return len(value)
+    if isinstance(value, dict) and "bdata" in value:
+        import numpy as np
+        return len(base64.b64decode(value["bdata"])) // np.dtype(value["dtype"]).itemsize
+    return 0
+
+
+def _take_every(value, step: int):
+    """
+    Keep every step-th point of a plain list or a Plotly typed array.
+    
+    Typed arrays can be 2-D: Plotly Express writes hover_data / custom_data
+    as one `customdata` array with shape "N, k" (k values per point). Those
+    are reshaped and thinned along the first axis (the points), so each
+    kept point keeps its own hover values.
+    """
+    if isinstance(value, list):
+        return value[::step]
+    if isinstance(value, dict) and "bdata" in value:
+        import numpy as np
+        array = np.frombuffer(base64.b64decode(value["bdata"]), dtype=value["dtype"])
+        if "shape" in value:
+            shape = tuple(int(size) for size in str(value["shape"]).split(","))
+            array = array.reshape(shape)
+        thinned = array[::step]
+        result = {
+            "dtype": value["dtype"],
+            "bdata": base64.b64encode(thinned.tobytes()).decode("ascii")
+        }
+        if "shape" in value:
+            result["shape"] = ", ".join(str(size) for size in thinned.shape)
+        return result
+    return value
+
+
+def downsample_chart(figure: dict, max_points: int = CHART_MAX_POINTS) -> bool:
+    """
+    Thin out scatter traces in a Plotly figure dict (in place) if it's huge.
+    
+    Parameters:
+    -----------
+    figure : dict
+        The parsed chart JSON ({"data": [...], "layout": {...}})
+    max_points : int
+        Total scatter points to keep, at most (approximately)
+        
+    Returns:
+    --------
+    bool
+        True if the figure was downsampled
+    """
+    
+    traces = [
+        trace for trace in figure.get("data", [])
+        if trace.get("type", "scatter") in ("scatter", "scattergl")
+    ]
+    total = sum(
+        max(_point_count(trace.get("x")), _point_count(trace.get("y")))
+        for trace in traces
+    )
+    if total <= max_points:
+        return False
+    
+    step = -(-total // max_points)  # Ceiling division
+    for trace in traces:
+        for key in _POINT_KEYS:
+            if key in trace:
+                trace[key] = _take_every(trace[key], step)
+        marker = trace.get("marker")
+        if isinstance(marker, dict):
+            for key in _MARKER_POINT_KEYS:
+                if key in marker:
+                    marker[key] = _take_every(marker[key], step)
+    
+    return True
+
+
+def use_webgl(figure: dict, min_points: int = CHART_WEBGL_POINTS) -> None:
+    """
+    Switch big scatter traces in a Plotly figure dict (in place) to scattergl.
+    
+    Traces that WebGL can't draw the same way (stacked areas) stay SVG.
+    Properties scattergl doesn't support (e.g. line.shape="spline") are
+    dropped when the figure is built with skip_invalid=True.
+    """
+    for trace in figure.get("data", []):
+        if (
+            trace.get("type", "scatter") == "scatter"
+            and "stackgroup" not in trace
+            and max(_point_count(trace.get("x")), _point_count(trace.get("y"))) > min_points
+        ):
+            trace["type"] = "scattergl"
+
+
+# Runs of backticks, used by code_fence() to pick a fence that can't be closed early
+_BACKTICK_RUN_RE = re.compile(r"`+")
+
+
+def code_fence(text: str, language: str = "") -> str:
+    """
+    Wrap text in a markdown code block that its content cannot close.
+    
+    Tool results are arbitrary text (sheet cells, error messages) and may
+    contain ``` themselves, which would end a ```-fence early and render
+    the rest of the log as markdown. Markdown lets a fence be any run of 3+
+    backticks and only closes it with a run at least as long, so we use one
+    backtick more than the longest run in the text.
+    """
+    longest = max((len(run) for run in _BACKTICK_RUN_RE.findall(text)), default=0)
+    fence = "`" * max(3, longest + 1)
+    return f"{fence}{language}\n{text}\n{fence}"
+
 # =============================================================================
 # SIDEBAR: MCP AGENT INFORMATION
 # =============================================================================
@@ -195,46 +394,135 @@ if submit_button:
     
     try:
         # =====================================================================
-        # RUN THE MULTI-AGENT PIPELINE WITH PROGRESS DISPLAY
+        # REPEATED SUBMISSIONS
         # =====================================================================
-        # We use st.status() to show users which agent is currently running.
-        # This provides transparency into the "thinking" process.
+        # Clicking "Analyze" again with the same question a moment later
+        # (double-clicks, re-checking a result) would re-run every agent and
+        # make the same LLM calls. We remember the last run in
+        # st.session_state and show its results directly when the question
+        # is the same (ignoring case and spacing) within REPEAT_WINDOW_SECONDS.
         #
-        # st.status() creates an expandable container that shows:
-        # - Current status (running, complete, error)
-        # - Detailed steps inside (we add these as agents run)
+        # The window is short on purpose: the data comes live from Google
+        # Sheets, so after a while a repeated question should fetch again.
         # =====================================================================
         
-        with st.status("🤖 Analyzing your data...", expanded=True) as status:
-            # Step 1: Build the graph
-            st.write("📋 Initializing analysis pipeline...")
-            graph = build_graph()
-            
-            # Step 2: Prepare initial state
-            # The autonomous MCP agent only needs the user's question.
-            # It will search Google Sheets, find relevant data, and fetch it
-            # without any manual URL input from the user.
-            initial_state = {
-                "user_question": user_question
-            }
-            
-            # Step 3: Run the full pipeline
-            # We show which agents are running for transparency
-            # MCP agent is first - it AUTONOMOUSLY finds and fetches data
-            st.write("🔌 **MCP Sheets Agent:** Searching for relevant data...")
-            st.write("🔍 **Schema Agent:** Reading dataset structure...")
-            st.write("🎯 **Intent Agent:** Understanding your question...")
-            st.write("💻 **Code Writer Agent:** Generating analysis code...")
-            st.write("⚙️ **Executor Agent:** Running the analysis...")
-            st.write("📝 **Narrative Agent:** Creating explanation...")
-            st.write("✅ **Critic Agent:** Evaluating results...")
+        run_key = hashlib.blake2b(
+            " ".join(user_question.lower().split()).encode("utf-8"),
+            digest_size=16
+        ).hexdigest()
+        last_run = st.session_state.get("last_run")
+        
+        if (
+            last_run is not None
+            and last_run["key"] == run_key
+            and time.monotonic() - last_run["finished_at"] < REPEAT_WINDOW_SECONDS
+        ):
+            final_state = last_run["state"]
+            st.caption("♻️ Same question as your last run - showing those results.")
+        else:
+            # =================================================================
+            # RUN THE MULTI-AGENT PIPELINE WITH PROGRESS DISPLAY
+            # =================================================================
+            # We use st.status() to show users which agent is currently running.
+            # This provides transparency into the "thinking" process.
+            #
+            # st.status() creates an expandable container that shows:
+            # - Current status (running, complete, error)
+            # - Detailed steps inside (we add these as agents run)
+            # =================================================================
             
-            # Execute the graph
-            # graph.invoke() runs all agents in sequence and returns final state
-            final_state = graph.invoke(initial_state)
+            with st.status("🤖 Analyzing your data...", expanded=True) as status:
+                # Step 1: Build the graph
+                st.write("📋 Initializing analysis pipeline...")
+                graph = get_graph()
+                
+                # Step 2: Prepare initial state
+                # The autonomous MCP agent only needs the user's question.
+                # It will search Google Sheets, find relevant data, and fetch it
+                # without any manual URL input from the user.
+                initial_state = {
+                    "user_question": user_question
+                }
+                
+                # Step 3: Run the full pipeline
+                # We show which agents are running for transparency
+                # MCP agent is first - it AUTONOMOUSLY finds and fetches data
+                #
+                # The lines are sent as ONE markdown element: each st.write() is
+                # a separate message to the browser (and a separate re-layout),
+                # and these lines are all known up front anyway.
+                st.markdown("\n\n".join(
+                    f"{icon} **{name}:** {description}"
+                    for icon, name, description in PIPELINE_STEPS.values()
+                ))
+                
+                # Execute the graph
+                # graph.stream() runs all agents in sequence, like graph.invoke(),
+                # but also hands us events while it runs:
+                # - "updates": each node's state changes, merged into final_state
+                # - "messages": LLM tokens as they are generated
+                #
+                # We show the narrative_agent's tokens live with st.write_stream(),
+                # so the explanation appears word by word instead of after the
+                # whole pipeline finishes. The generator is exhausted only when the
+                # graph is done, so final_state is complete afterwards.
+                #
+                # Each "updates" event also means an agent just finished, so we
+                # put the progress in the status label ("3/7 - Intent Agent
+                # done"). Users can then see where a slow run is, instead of a
+                # static list they can't tell apart from a hang. The number is
+                # the agent's position in the pipeline, so a retry (critic FAIL
+                # -> code writer again, see graph.py) shows as steps 4-7 again.
+                #
+                # On a retry the narrative is written again, so we stream a
+                # short separator first; the Explanation below always shows
+                # the final attempt.
+                #
+                # The live copy is only a preview: it is streamed into a
+                # placeholder that is cleared once the run is done, so the
+                # narrative is shown once (in the Explanation box), not twice.
+                final_state = dict(initial_state)
+                
+                def narrative_tokens():
+                    step_numbers = {node: i for i, node in enumerate(PIPELINE_STEPS, 1)}
+                    for mode, payload in graph.stream(
+                        initial_state, stream_mode=["updates", "messages"]
+                    ):
+                        if mode == "updates":
+                            for node, update in payload.items():
+                                update = dict(update or {})
+                                # mcp_tool_calls is an appended log (see state.py):
+                                # updates hold only the new entries, so extend.
+                                final_state.setdefault("mcp_tool_calls", []).extend(
+                                    update.pop("mcp_tool_calls", [])
+                                )
+                                final_state.update(update)
+                                if node == "code_writer_agent" and update.get("retry_count"):
+                                    yield "\n\n---\n\n*🔁 Retrying with the reviewer's feedback...*\n\n"
+                                if node in PIPELINE_STEPS:
+                                    status.update(label=(
+                                        f"🤖 Analyzing your data... {step_numbers[node]}/{len(PIPELINE_STEPS)}"
+                                        f" - {PIPELINE_STEPS[node][1]} done"
+                                    ))
+                        else:
+                            chunk, metadata = payload
+                            if metadata.get("langgraph_node") == "narrative_agent" and chunk.content:
+                                yield chunk.content
+                
+                live_narrative = st.empty()
+                with live_narrative.container():
+                    st.write_stream(narrative_tokens())
+                live_narrative.empty()
+                
+                # Update status to complete
+                status.update(label="✅ Analysis complete!", state="complete", expanded=False)
             
-            # Update status to complete
-            status.update(label="✅ Analysis complete!", state="complete", expanded=False)
+            # Remember this run for an immediate repeat (see REPEATED SUBMISSIONS)
+            st.session_state["last_run"] = {
+                "key": run_key,
+                "finished_at": time.monotonic(),
+                "state": final_state
+            }
         
         # =====================================================================
         # DISPLAY RESULTS
@@ -252,7 +540,12 @@ if submit_button:
         # DISPLAY CHART (if available)
         # -----------------------------------------------------------------
         # The chart is stored as JSON in state["chart_json"].
-        # We convert it back to a Plotly figure using pio.from_json().
+        # We parse it with orjson (several times faster than the stdlib json
+        # that pio.from_json() uses, which matters for charts with many
+        # points) and build the figure from the resulting dict.
+        # skip_invalid=True makes Plotly drop any property it doesn't
+        # recognize instead of failing the whole chart - the same figure
+        # pio.from_json() would build, minus the error.
         #
         # st.plotly_chart() renders interactive Plotly charts in Streamlit.
         # - use_container_width=True makes the chart fill the available width
@@ -262,12 +555,24 @@ if submit_button:
         
         if chart_json:
             try:
-                # Convert JSON back to Plotly figure
-                fig = pio.from_json(chart_json)
+                import plotly.graph_objects as go
+                
+                # Convert JSON back to Plotly figure, thinning out huge
+                # scatter traces and drawing big ones with WebGL first
+                # (see LARGE CHARTS above)
+                figure = orjson.loads(chart_json)
+                downsampled = downsample_chart(figure)
+                use_webgl(figure)
+                fig = go.Figure(figure, skip_invalid=True)
                 
                 # Display the interactive chart
                 # Users can hover, zoom, pan, and download
                 st.plotly_chart(fig, use_container_width=True)
+                if downsampled:
+                    st.caption(
+                        f"Large chart: showing an evenly spaced sample of about "
+                        f"{CHART_MAX_POINTS:,} points."
+                    )
             except Exception as chart_error:
                 st.warning(f"Could not display chart: {str(chart_error)}")
         else:
@@ -339,7 +644,11 @@ if submit_button:
         
         if mcp_tool_calls:
             with st.expander("🔌 MCP Tool Calls", expanded=True):
-                st.markdown("**The agent autonomously called these tools:**")
+                # All steps are rendered as ONE markdown element instead of
+                # 3-4 elements per call (title, st.json, caption, divider):
+                # a long agent run can make a dozen tool calls, and every
+                # element is a separate message and DOM node in the browser.
+                steps = []
                 
                 for i, call in enumerate(mcp_tool_calls, 1):
                     tool_name = call.get("tool", "unknown")
@@ -347,18 +656,27 @@ if submit_button:
                     result = call.get("result", "")
                     
                     # Display each tool call as a step
-                    st.markdown(f"**Step {i}: `{tool_name}`**")
+                    step = [f"**Step {i}: `{tool_name}`**"]
                     
                     # Show arguments if any
+                    # We serialize with orjson; default=str covers any
+                    # non-JSON values.
                     if args:
-                        st.json(args)
+                        args_json = orjson.dumps(
+                            args, default=str, option=orjson.OPT_INDENT_2
+                        ).decode()
+                        step.append(code_fence(args_json, "json"))
                     
                     # Show result preview if available
                     if result:
-                        st.caption(f"Result: {result}")
+                        step.append("Result:\n" + code_fence(str(result), "text"))
                     
-                    if i < len(mcp_tool_calls):
-                        st.divider()
+                    steps.append("\n\n".join(step))
+                
+                st.markdown(
+                    "**The agent autonomously called these tools:**\n\n"
+                    + "\n\n---\n\n".join(steps)
+                )
         
         # -----------------------------------------------------------------
         # OPTIONAL: SHOW TECHNICAL DETAILS (EXPANDABLE)
@@ -466,6 +784,7 @@ st.caption("Built with ❤️ using LangGraph, OpenAI, MCP (via Smithery), Strea
 #
 # In this app:
 # - The form prevents analysis from running on every keystroke
+# - The compiled graph is built once and cached with @st.cache_resource
 # - The MCP agent autonomously finds and fetches data - no session state needed for URLs
 # - The MCP agent handles temp file management (saves to temp/fetched_sheet.csv)
 # - Tool calls are logged in the state for displaying agent reasoning in the UI
@@ -65,6 +65,7 @@ steps, or branching based on question type).
 =============================================================================
 """
 
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, START, END
 from state import AnalystState
 
@@ -72,13 +73,32 @@ from state import AnalystState
 # NOTE: mcp_sheets_agent is imported first because it runs first in the pipeline.
 # It is the data acquisition layer that fetches Google Sheets data via MCP
 # and makes it available to all downstream agents as a local CSV file.
-from agents.mcp_sheets_agent import mcp_sheets_agent
-from agents.schema_agent import schema_agent
-from agents.intent_agent import intent_agent
-from agents.code_writer_agent import code_writer_agent
+from agents.mcp_sheets_agent import mcp_sheets_agent, amcp_sheets_agent
+from agents.schema_agent import schema_agent, aschema_agent
+from agents.intent_agent import intent_agent, aintent_agent
+from agents.code_writer_agent import code_writer_agent, acode_writer_agent
 from agents.executor_agent import executor_agent
-from agents.narrative_agent import narrative_agent
-from agents.critic_agent import critic_agent
+from agents.narrative_agent import narrative_agent, anarrative_agent
+from agents.critic_agent import critic_agent, acritic_agent
+
+# How many times a FAIL verdict sends the run back to code_writer_agent.
+# Each retry costs a code writer, narrative, and critic call, so we keep it small.
+MAX_CODE_RETRIES = 2
+
+
+def should_retry(state: AnalystState) -> str:
+    """
+    Decide where to go after critic_agent.
+    
+    Returns "code_writer_agent" to try the code again when the critic said
+    FAIL and we still have retries left, otherwise END.
+    """
+    if (
+        state.get("critic_score") == "FAIL"
+        and state.get("retry_count", 0) < MAX_CODE_RETRIES
+    ):
+        return "code_writer_agent"
+    return END
 
 
 def build_graph():
@@ -154,24 +174,43 @@ def build_graph():
     # ORDER OF add_node CALLS:
     # The order doesn't affect execution - that's determined by edges.
     # We add them in logical order for readability.
+    #
+    # SYNC + ASYNC NODES:
+    # Agents that have an async twin are wrapped in RunnableLambda(sync,
+    # afunc=async). graph.invoke() (Streamlit) calls the sync function;
+    # graph.ainvoke()/astream() (LangGraph Studio) awaits the async one, so
+    # LLM calls (and schema_agent's file work) don't block the server's
+    # event loop.
     # =========================================================================
     
     # Node 0: MCP Sheets Agent (DATA ACQUISITION - runs first)
     # Fetches data from Google Sheets via MCP and saves it as a local CSV.
     # This is the adapter layer between the MCP world and the pandas world.
-    workflow.add_node("mcp_sheets_agent", mcp_sheets_agent)
+    workflow.add_node(
+        "mcp_sheets_agent",
+        RunnableLambda(mcp_sheets_agent, afunc=amcp_sheets_agent)
+    )
     
     # Node 1: Schema Agent
     # Analyzes the CSV structure and creates a summary
-    workflow.add_node("schema_agent", schema_agent)
+    workflow.add_node(
+        "schema_agent",
+        RunnableLambda(schema_agent, afunc=aschema_agent)
+    )
     
     # Node 2: Intent Agent
     # Parses the user's question into a precise instruction
-    workflow.add_node("intent_agent", intent_agent)
+    workflow.add_node(
+        "intent_agent",
+        RunnableLambda(intent_agent, afunc=aintent_agent)
+    )
     
     # Node 3: Code Writer Agent
     # Generates Python/Plotly code to answer the question
-    workflow.add_node("code_writer_agent", code_writer_agent)
+    workflow.add_node(
+        "code_writer_agent",
+        RunnableLambda(code_writer_agent, afunc=acode_writer_agent)
+    )
     
     # Node 4: Executor Agent
     # Runs the generated code and captures results
@@ -179,11 +218,17 @@ def build_graph():
     
     # Node 5: Narrative Agent
     # Creates a plain English explanation of the results
-    workflow.add_node("narrative_agent", narrative_agent)
+    workflow.add_node(
+        "narrative_agent",
+        RunnableLambda(narrative_agent, afunc=anarrative_agent)
+    )
     
     # Node 6: Critic Agent
     # Evaluates whether the answer addressed the question
-    workflow.add_node("critic_agent", critic_agent)
+    workflow.add_node(
+        "critic_agent",
+        RunnableLambda(critic_agent, afunc=acritic_agent)
+    )
     
     # =========================================================================
     # STEP 3: Define edges (connections between nodes)
@@ -200,9 +245,10 @@ def build_graph():
     # These are imported from langgraph.graph and represent the graph's
     # boundaries.
     #
-    # EDGE TYPES (not all used here, but good to know):
-    # - Unconditional: Always follows this edge (what we use)
-    # - Conditional: Uses a function to decide which edge to follow
+    # EDGE TYPES:
+    # - Unconditional: Always follows this edge (used between agents)
+    # - Conditional: Uses a function to decide which edge to follow (used
+    #   after critic_agent, to retry the code on a FAIL)
     # =========================================================================
     
     # Connect START to the first agent
@@ -229,9 +275,17 @@ def build_graph():
     # narrative_agent → critic_agent: narrative must exist before evaluation
     workflow.add_edge("narrative_agent", "critic_agent")
     
-    # Connect the last agent to END
-    # This defines where execution completes
-    workflow.add_edge("critic_agent", END)
+    # critic_agent → END, or back to code_writer_agent on a FAIL
+    # This is a CONDITIONAL edge: should_retry() looks at the critic's
+    # verdict and returns the name of the next node. A rejected answer gets
+    # another attempt at the code (with the critique as feedback) without
+    # re-running the MCP fetch, schema, and intent steps, whose outputs are
+    # still valid. MAX_CODE_RETRIES bounds the loop.
+    workflow.add_conditional_edges(
+        "critic_agent",
+        should_retry,
+        {"code_writer_agent": "code_writer_agent", END: END}
+    )
     
     # =========================================================================
     # STEP 4: Compile the graph
@@ -251,10 +305,46 @@ def build_graph():
     # =========================================================================
     
     compiled_graph = workflow.compile()
-    
+
     return compiled_graph
 
 
+# How many questions arun_batch() pushes through the graph at the same time.
+# Kept well under typical OpenAI rate limits (each run makes 4+ LLM calls).
+BATCH_MAX_CONCURRENCY = 8
+
+
+async def arun_batch(graph, states: list, max_concurrency: int = BATCH_MAX_CONCURRENCY) -> list:
+    """
+    Run several questions through the same compiled graph concurrently.
+
+    Calling graph.invoke() in a for loop waits for every LLM call of one
+    question before starting the next. abatch() starts all runs on the
+    event loop at once, so while one run waits on the network the others
+    make progress.
+
+    Parameters:
+    -----------
+    graph : CompiledGraph
+        The graph returned by build_graph().
+    states : list
+        One initial state per question (same shape as for graph.invoke()).
+    max_concurrency : int
+        Maximum number of runs in flight at once.
+
+    Returns:
+    --------
+    list
+        The final states, in the same order as the inputs.
+
+    How to Use:
+    ----------
+    graph = build_graph()
+    results = asyncio.run(arun_batch(graph, [state_1, state_2, state_3]))
+    """
+    return await graph.abatch(states, config={"max_concurrency": max_concurrency})
+
+
 # =============================================================================
 # UNDERSTANDING GRAPH EXECUTION
 # =============================================================================
@@ -289,7 +379,8 @@ def build_graph():
 # FUTURE ENHANCEMENTS
 # =============================================================================
 #
-# This graph is simple (linear flow), but LangGraph supports much more:
+# This graph is simple (a linear flow with one retry loop), but LangGraph
+# supports much more:
 #
 # 1. CONDITIONAL ROUTING:
 #    def route_by_question_type(state):
@@ -300,25 +391,14 @@ def build_graph():
 #    
 #    workflow.add_conditional_edges("intent_agent", route_by_question_type)
 #
-# 2. RETRY LOOPS:
-#    If critic_agent returns FAIL, loop back to code_writer_agent:
-#    
-#    def should_retry(state):
-#        if state["critic_score"] == "FAIL" and state.get("retry_count", 0) < 3:
-#            return "code_writer_agent"  # Try again
-#        else:
-#            return END
-#    
-#    workflow.add_conditional_edges("critic_agent", should_retry)
-#
-# 3. PARALLEL EXECUTION:
+# 2. PARALLEL EXECUTION:
 #    Run multiple agents simultaneously and merge their outputs:
 #    
 #    workflow.add_node("sentiment_agent", sentiment_agent)
 #    workflow.add_node("key_metrics_agent", key_metrics_agent)
 #    # Both run in parallel after executor_agent
 #
-# 4. HUMAN-IN-THE-LOOP:
+# 3. HUMAN-IN-THE-LOOP:
 #    Pause execution for human approval before certain steps:
 #    
 #    workflow.compile(interrupt_before=["executor_agent"])
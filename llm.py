@@ -0,0 +1,406 @@
+"""
+=============================================================================
+LLM.PY - Shared Helpers for Calling the LLM
+=============================================================================
+
+This module contains small helpers that sit between the agents and the
+LangChain chat model. Agents still build their own prompts; these helpers
+only decide HOW the request is sent.
+
+SHARED CLIENTS:
+--------------
+Building a ChatOpenAI object re-reads configuration and sets up a new HTTP
+connection pool, so constructing one inside every agent call means a fresh
+TCP + TLS handshake per LLM request. get_llm() builds each distinct client
+(model, temperature, extra options) once per process and hands the same
+object back afterwards, so keep-alive connections are reused across calls.
+
+EXACT-MATCH RESPONSE CACHE:
+--------------------------
+Streamlit re-runs, retries, and demos often send the exact same prompt to
+the LLM more than once. With temperature=0 the answer is (for practical
+purposes) deterministic, so paying for a second round-trip is wasted time
+and money.
+
+cached_invoke() hashes everything that affects the response (model,
+sampling parameters, and every message) and keeps the answer in:
+
+1. An in-memory LRU (always on) - hits return in microseconds
+2. A diskcache.Cache directory (optional) - survives process restarts
+
+PROVIDER PREFIX CACHE HINTS:
+---------------------------
+OpenAI caches long prompt prefixes automatically, but only on the server
+that handled the earlier request. prompt_cache_options() derives a
+"prompt_cache_key" from the stable part of a prompt (e.g. the dataset
+schema) so requests sharing that prefix are routed to the same cache. It
+returns no options for other OpenAI-compatible backends, which may reject
+unknown request fields.
+
+acached_invoke() is the async twin (awaits llm.ainvoke()) and shares the
+same cache, for agents that run inside an event loop. cached_batch() does
+the same for many requests at once: hits are answered from the cache and
+only the misses are sent, concurrently, with llm.batch().
+
+WHEN THE CACHE IS BYPASSED:
+- temperature > 0 (or unset): the caller asked for varied output, so
+  replaying an old answer would change behavior.
+
+STRUCTURED OUTPUT:
+-----------------
+structured_output_options() asks for JSON-schema constrained output
+(response_format={"type": "json_schema", ...}) on the OpenAI API only.
+Many OpenAI-compatible backends (older vLLM, Ollama, some Azure
+api-versions) reject that field with HTTP 400 instead of ignoring it, so
+there the prompt alone asks for JSON and the caller parses defensively.
+
+=============================================================================
+"""
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List
+
+from dotenv import load_dotenv
+from langchain_openai import ChatOpenAI
+from langchain_core.messages import BaseMessage
+
+# Load environment variables from .env file
+# This module is imported once per process, so .env is only parsed once.
+load_dotenv()
+
+# Get configuration from environment variables
+# BASE_URL allows using alternative OpenAI-compatible APIs (e.g., Azure, local LLMs)
+# OPENAI_API_KEY is your authentication token for the API
+#
+# These are read ONCE, at import time. Call reload_config() after changing
+# the environment (e.g. in a test) to pick up new values.
+BASE_URL = os.getenv("BASE_URL", "https://api.openai.com/v1")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+# diskcache is optional. Without it we still get the in-memory cache.
+try:
+    import diskcache
+except ImportError:
+    diskcache = None
+
+# Maximum number of responses kept in memory (least recently used evicted)
+RESPONSE_CACHE_SIZE = 512
+
+# Directory for the persistent cache. Set LLM_CACHE_DIR="" to disable it.
+RESPONSE_CACHE_DIR = os.getenv("LLM_CACHE_DIR", ".llm_cache")
+
+# In-memory LRU: OrderedDict keeps insertion order, move_to_end() marks use.
+# Streamlit serves each session on its own thread, so access is guarded.
+_response_cache = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+_disk_cache = None
+
+# One ChatOpenAI per distinct configuration, shared by every caller
+_llm_clients = {}
+_llm_clients_lock = threading.Lock()
+
+
+def get_llm(model: str, temperature: float, **kwargs) -> ChatOpenAI:
+    """
+    Return a shared ChatOpenAI client for this configuration.
+
+    Parameters:
+    -----------
+    model : str
+        The model name (e.g. "gpt-4o")
+    temperature : float
+        Sampling temperature (0 = deterministic)
+    **kwargs
+        Any other ChatOpenAI options (e.g. max_tokens). They are part of the
+        lookup key, so different options get different clients.
+
+    Returns:
+    --------
+    ChatOpenAI
+        The same object for every call with the same arguments
+    """
+
+    key = (model, temperature, repr(sorted(kwargs.items())))
+
+    with _llm_clients_lock:
+        if key not in _llm_clients:
+            # Checked here (once per client) rather than on every request:
+            # failing early gives a clear message instead of an auth error
+            # from deep inside the first LLM call.
+            if not OPENAI_API_KEY:
+                raise RuntimeError(
+                    "OPENAI_API_KEY not configured. "
+                    "Please set it in your .env file."
+                )
+            _llm_clients[key] = ChatOpenAI(
+                base_url=BASE_URL,
+                api_key=OPENAI_API_KEY,
+                model=model,
+                temperature=temperature,
+                **kwargs
+            )
+        return _llm_clients[key]
+
+
+def reload_config() -> None:
+    """
+    Re-read BASE_URL / OPENAI_API_KEY from the environment.
+
+    Existing clients were built with the old values, so they are dropped;
+    the next get_llm() call builds new ones.
+    """
+
+    global BASE_URL, OPENAI_API_KEY
+
+    load_dotenv(override=True)
+    with _llm_clients_lock:
+        BASE_URL = os.getenv("BASE_URL", "https://api.openai.com/v1")
+        OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+        _llm_clients.clear()
+
+
+def _is_openai_api() -> bool:
+    """True when BASE_URL points at the OpenAI API itself."""
+    return "api.openai.com" in BASE_URL
+
+
+def structured_output_options(response_format: dict) -> dict:
+    """
+    Return model_kwargs that request a JSON-schema constrained response.
+
+    Parameters:
+    -----------
+    response_format : dict
+        The {"type": "json_schema", ...} response format
+
+    Returns:
+    --------
+    dict
+        {"response_format": response_format} for get_llm(model_kwargs=...),
+        or {} when the backend is not the OpenAI API (see STRUCTURED OUTPUT
+        above)
+    """
+
+    if not _is_openai_api():
+        return {}
+    return {"response_format": response_format}
+
+
+def prompt_cache_options(stable_prefix: str) -> dict:
+    """
+    Return extra request options that help the provider reuse its cache.
+
+    Parameters:
+    -----------
+    stable_prefix : str
+        The part of the prompt that repeats across requests (e.g. the
+        dataset summary). Requests with the same prefix get the same key.
+
+    Returns:
+    --------
+    dict
+        Keyword arguments for llm.invoke() / cached_invoke(), or {} when
+        the backend is not the OpenAI API
+    """
+
+    if not _is_openai_api():
+        return {}
+
+    digest = hashlib.blake2b(stable_prefix.encode("utf-8"), digest_size=16).hexdigest()
+    return {"extra_body": {"prompt_cache_key": digest}}
+
+
+def _get_disk_cache():
+    """Return the persistent cache, creating it on first use (or None)."""
+    global _disk_cache
+    if _disk_cache is None and diskcache is not None and RESPONSE_CACHE_DIR:
+        _disk_cache = diskcache.Cache(RESPONSE_CACHE_DIR)
+    return _disk_cache
+
+
+def _cache_key(llm, messages: List[BaseMessage]) -> str:
+    """
+    Build a stable key for an LLM request.
+
+    Everything that can change the response is part of the key: the model,
+    its sampling/output parameters, and the type + content of each message.
+
+    Message content is only lightly normalized first: line endings are
+    unified and leading/trailing whitespace is stripped, so a prompt that
+    differs only in a trailing newline or in Windows vs Unix line endings
+    shares one entry.
+    Whitespace INSIDE the content is kept as is - messages quote code
+    (where indentation is meaning) and data samples (where spaces in a
+    cell are data), so prompts that differ there must not share an answer.
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+
+    parts = [
+        str(getattr(llm, "model_name", "")),
+        repr(getattr(llm, "temperature", None)),
+        repr(getattr(llm, "max_tokens", None)),
+        repr(sorted(getattr(llm, "model_kwargs", {}).items())),
+    ]
+    for message in messages:
+        parts.append(message.type)
+        content = str(message.content).replace("\r\n", "\n").replace("\r", "\n")
+        parts.append(content.strip())
+
+    # NUL separators so ("ab", "c") and ("a", "bc") hash differently
+    hasher.update("\x00".join(parts).encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def _remember(key: str, content: str) -> None:
+    """Save a response in the in-memory LRU, evicting the oldest entries."""
+    with _response_cache_lock:
+        _response_cache[key] = content
+        _response_cache.move_to_end(key)
+        while len(_response_cache) > RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+
+
+def _cache_lookup(key: str):
+    """Return the cached response for key (memory first, then disk) or None."""
+    with _response_cache_lock:
+        if key in _response_cache:
+            _response_cache.move_to_end(key)
+            return _response_cache[key]
+
+    disk_cache = _get_disk_cache()
+    content = disk_cache.get(key) if disk_cache is not None else None
+    if content is not None:
+        # Promote persistent hits so the next lookup is memory-only
+        _remember(key, content)
+    return content
+
+
+def _cache_store(key: str, content: str) -> None:
+    """Save a freshly generated response in memory and on disk."""
+    disk_cache = _get_disk_cache()
+    if disk_cache is not None:
+        disk_cache.set(key, content)
+    _remember(key, content)
+
+
+def cached_invoke(llm, messages: List[BaseMessage], **kwargs) -> str:
+    """
+    Invoke the LLM and return the response text, reusing identical requests.
+
+    Parameters:
+    -----------
+    llm : BaseChatModel
+        The LangChain chat model (e.g. ChatOpenAI) to call on a cache miss
+    messages : List[BaseMessage]
+        The messages to send, exactly as they would go to llm.invoke()
+    **kwargs
+        Extra request options passed to llm.invoke() on a miss. They are NOT
+        part of the cache key, so only pass options that don't change the
+        answer (like prompt_cache_options()).
+
+    Returns:
+    --------
+    str
+        The response content (same as llm.invoke(messages).content)
+    """
+
+    # Only deterministic requests are safe to replay
+    if getattr(llm, "temperature", None) != 0:
+        return llm.invoke(messages, **kwargs).content
+
+    key = _cache_key(llm, messages)
+
+    content = _cache_lookup(key)
+    if content is None:
+        # Miss: call the LLM
+        content = llm.invoke(messages, **kwargs).content
+        _cache_store(key, content)
+
+    return content
+
+
+async def acached_invoke(llm, messages: List[BaseMessage], **kwargs) -> str:
+    """
+    Async version of cached_invoke() - awaits llm.ainvoke() on a miss.
+
+    Uses the same cache, so a response stored by a sync call is a hit here
+    (and vice versa).
+    """
+
+    if getattr(llm, "temperature", None) != 0:
+        return (await llm.ainvoke(messages, **kwargs)).content
+
+    key = _cache_key(llm, messages)
+
+    content = _cache_lookup(key)
+    if content is None:
+        content = (await llm.ainvoke(messages, **kwargs)).content
+        _cache_store(key, content)
+
+    return content
+
+
+def cached_batch(
+    llm,
+    message_lists: List[List[BaseMessage]],
+    max_concurrency: int = None,
+    **kwargs
+) -> List[str]:
+    """
+    Invoke the LLM for several requests, reusing cached responses.
+
+    Cache misses are sent together with llm.batch(), which issues the
+    requests concurrently instead of paying one round-trip after another.
+
+    Parameters:
+    -----------
+    llm : BaseChatModel
+        The LangChain chat model to call for cache misses
+    message_lists : List[List[BaseMessage]]
+        One message list per request
+    max_concurrency : int
+        Maximum number of requests in flight at once (None = LangChain's default)
+    **kwargs
+        Extra request options passed to llm.batch() (and so to every request)
+        on a miss. Like in cached_invoke(), they are NOT part of the cache
+        key, so only pass options that don't change the answer.
+
+    Returns:
+    --------
+    List[str]
+        The response content for each request, in the same order
+    """
+
+    config = {"max_concurrency": max_concurrency} if max_concurrency else None
+
+    if getattr(llm, "temperature", None) != 0:
+        return [
+            response.content
+            for response in llm.batch(message_lists, config=config, **kwargs)
+        ]
+
+    keys = [_cache_key(llm, messages) for messages in message_lists]
+    results = [_cache_lookup(key) for key in keys]
+
+    # Send each distinct missing request once (duplicates share the answer)
+    missing = {}
+    for key, messages, content in zip(keys, message_lists, results):
+        if content is None and key not in missing:
+            missing[key] = messages
+
+    if missing:
+        responses = llm.batch(list(missing.values()), config=config, **kwargs)
+        fetched = {}
+        for key, response in zip(missing.keys(), responses):
+            fetched[key] = response.content
+            _cache_store(key, response.content)
+        results = [
+            fetched[key] if content is None else content
+            for key, content in zip(keys, results)
+        ]
+
+    return results
@@ -2,7 +2,7 @@
 # PROMPTS PACKAGE - __init__.py
 # =============================================================================
 # This file marks the 'prompts' directory as a Python package.
-# It allows us to import prompts using: from prompts.prompts import INTENT_PARSER_PROMPT
+# It allows us to import prompts using: from prompts.prompts import INTENT_PARSER_SYSTEM_PROMPT
 #
 # CENTRALIZING PROMPTS:
 # Keeping all prompt templates in one place makes it easier to:
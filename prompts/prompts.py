@@ -40,13 +40,10 @@ PROMPT ENGINEERING NOTES:
 # Purpose: Convert vague user questions into precise, actionable instructions
 # =============================================================================
 
-INTENT_PARSER_PROMPT = """You are an expert data analyst assistant. Your job is to take a user's natural language question about their data and convert it into a precise, unambiguous data analysis instruction.
-
-## DATASET STRUCTURE:
-{dataframe_summary}
-
-## USER'S QUESTION:
-{user_question}
+# NOTE: INTENT_PARSER_SYSTEM_PROMPT has no placeholders, so it is sent as-is
+# (no .format() call). It is byte-identical on every call, which lets the
+# provider cache it as a prompt prefix.
+INTENT_PARSER_SYSTEM_PROMPT = """You are an expert data analyst assistant. Your job is to take a user's natural language question about their data and convert it into a precise, unambiguous data analysis instruction.
 
 ## YOUR TASK:
 Rewrite the user's question as a precise data analysis instruction. Your output should specify:
@@ -67,7 +64,25 @@ Dataset has columns: date, region, product, sales_amount, units_sold
 Good parsed intent: "Create a line chart showing the sum of 'sales_amount' grouped by 'date' (aggregated to monthly level) to visualize the sales trend over time. Sort by date ascending."
 
 ## OUTPUT:
-Write ONLY the parsed intent instruction. Be specific and reference actual column names from the dataset. Do not include any other commentary.
+Respond with ONLY a JSON object with these keys:
+- "instruction": the full parsed intent instruction, as in the example above. Be specific and reference actual column names from the dataset.
+- "columns": the exact column names involved
+- "operation": the analytical operation
+- "filters": the filters to apply, or "" if none
+- "output_format": the expected output format
+- "sorting": how results should be ordered, or "" if not relevant
+
+Do not include any other commentary.
+"""
+
+# The dynamic tail of the intent parser prompt. The dataset structure comes
+# before the question so that, for repeat questions on the same dataset, the
+# shared prefix extends through the schema.
+INTENT_PARSER_USER_PROMPT = """## DATASET STRUCTURE:
+{dataframe_summary}
+
+## USER'S QUESTION:
+{user_question}
 """
 
 # =============================================================================
@@ -76,27 +91,19 @@ Write ONLY the parsed intent instruction. Be specific and reference actual colum
 # Purpose: Generate executable Python/Plotly code from parsed intent
 # =============================================================================
 
-CODE_WRITER_PROMPT = """You are an expert Python data analyst. Your job is to write clean, executable Python code that answers a data analysis question.
-
-## DATASET STRUCTURE:
-{dataframe_summary}
-
-## ANALYSIS INSTRUCTION:
-{parsed_intent}
+CODE_WRITER_SYSTEM_PROMPT = """You are an expert Python data analyst. Your job is to write clean, executable Python code that answers a data analysis question.
 
 ## REQUIREMENTS FOR YOUR CODE:
 
 ### Data Loading:
-- The CSV file path is available in a variable called `csv_path`
-- Load the data using: `df = pd.read_csv(csv_path)`
+- The data is ALREADY loaded into a pandas DataFrame called `df` - use it directly
+- Do NOT call `pd.read_csv()` again (the CSV file path is still available as `csv_path`)
 - Import pandas as pd and plotly.express as px at the top
 
 ### For Visualizations:
 - Use Plotly Express (px) for ALL charts - NOT matplotlib
 - Store the final figure in a variable called exactly `fig`
-- DO NOT call `fig.show()` - just define the figure
 - Add appropriate titles and axis labels
-- Use readable colors and formatting
 
 ### For Text/Table Results:
 - Store any text output in a variable called exactly `result_text`
@@ -105,37 +112,57 @@ CODE_WRITER_PROMPT = """You are an expert Python data analyst. Your job is to wr
 
 ### Code Quality:
 - Add brief inline comments explaining key steps
-- Use descriptive variable names
 - Handle potential edge cases (empty data, missing columns)
-- Keep the code simple and readable
 
 ## IMPORTANT RULES:
-1. ONLY output the Python code - no markdown, no explanations before/after
-2. Do NOT wrap code in ```python``` backticks
-3. Do NOT include `fig.show()` or `plt.show()` calls
-4. ALWAYS define at least `fig` or `result_text` (or both)
-5. Make sure the code is complete and runnable as-is
+1. ONLY output the Python code - no markdown, no ```python``` backticks, no explanations before/after
+2. Do NOT include `fig.show()` or `plt.show()` calls
+3. ALWAYS define at least `fig` or `result_text` (or both)
+4. Make sure the code is complete and runnable as-is
+5. Only import pandas, numpy, plotly and standard math/date/text modules - no file, OS or network access
+
+## DATASET STRUCTURE:
+{dataframe_summary}
+"""
+
+# The dynamic tail of the code writer prompt. It is sent as its own message
+# AFTER the system prompt above so the instructions + schema form a stable
+# prefix that the provider can cache across questions on the same dataset.
+CODE_WRITER_USER_PROMPT = """## ANALYSIS INSTRUCTION:
+{parsed_intent}
 
 ## OUTPUT:
 Write only the Python code, nothing else.
 """
 
+# Appended to CODE_WRITER_USER_PROMPT when critic_agent rejected the previous
+# answer and the graph loops back to the code writer (see graph.py).
+CODE_WRITER_RETRY_PROMPT = """
+## PREVIOUS ATTEMPT (REJECTED):
+The code below ran, but a reviewer judged that its result does not answer the request.
+
+### Code:
+{generated_code}
+
+### Output:
+{execution_result}
+
+### Reviewer feedback:
+{critique}
+
+Write a corrected version that fixes the problem described in the feedback. All the rules above still apply.
+"""
+
 # =============================================================================
 # NARRATIVE PROMPT
 # Used by: narrative_agent.py
 # Purpose: Convert technical results into plain English for business users
 # =============================================================================
 
-NARRATIVE_PROMPT = """You are a data analyst presenting findings to a non-technical business stakeholder. Your job is to explain data analysis results in clear, natural language.
-
-## ORIGINAL QUESTION:
-{user_question}
-
-## ANALYSIS PERFORMED:
-{parsed_intent}
-
-## RESULTS:
-{execution_result}
+# NARRATIVE_SYSTEM_PROMPT has no placeholders, so it is sent as-is (no
+# .format() call). It comes first so every narrative request shares the same
+# prefix, and the per-question values follow in NARRATIVE_USER_PROMPT.
+NARRATIVE_SYSTEM_PROMPT = """You are a data analyst presenting findings to a non-technical business stakeholder. Your job is to explain data analysis results in clear, natural language.
 
 ## YOUR TASK:
 Write a 3-5 sentence explanation of the results in plain English. 
@@ -159,22 +186,26 @@ Write a 3-5 sentence explanation of the results in plain English.
 Write only the narrative explanation, nothing else.
 """
 
+# The dynamic tail of the narrative prompt: everything that changes per request.
+NARRATIVE_USER_PROMPT = """## ORIGINAL QUESTION:
+{user_question}
+
+## ANALYSIS PERFORMED:
+{parsed_intent}
+
+## RESULTS:
+{execution_result}
+"""
+
 # =============================================================================
 # CRITIC PROMPT
 # Used by: critic_agent.py
 # Purpose: Evaluate if the final answer actually addresses the user's question
 # =============================================================================
 
-CRITIC_PROMPT = """You are a quality assurance evaluator for a data analysis system. Your job is to determine if the final answer actually addresses what the user originally asked.
-
-## ORIGINAL USER QUESTION:
-{user_question}
-
-## NARRATIVE ANSWER PROVIDED:
-{narrative}
-
-## RAW EXECUTION RESULTS:
-{execution_result}
+# NOTE: CRITIC_SYSTEM_PROMPT has no placeholders, so it is sent as-is (no
+# .format() call) and its braces are NOT doubled.
+CRITIC_SYSTEM_PROMPT = """You are a quality assurance evaluator for a data analysis system. Your job is to determine if the final answer actually addresses what the user originally asked.
 
 ## YOUR TASK:
 Evaluate whether the answer adequately addresses the user's question.
@@ -187,15 +218,26 @@ Consider:
 
 ## OUTPUT FORMAT (STRICT JSON):
 You must respond with ONLY a valid JSON object in exactly this format:
-{{"score": "PASS", "reason": "one sentence explaining why it passes"}}
+{"score": "PASS", "reason": "one sentence explaining why it passes"}
 or
-{{"score": "FAIL", "reason": "one sentence explaining what's missing or wrong"}}
+{"score": "FAIL", "reason": "one sentence explaining what's missing or wrong"}
 
 Rules:
 - Use exactly "PASS" or "FAIL" (all caps)
 - The reason should be ONE sentence only
 - Do not include any text outside the JSON object
 - Make sure the JSON is valid (proper quotes, no trailing commas)
+"""
+
+# The dynamic tail of the critic prompt: everything that changes per request.
+CRITIC_USER_PROMPT = """## ORIGINAL USER QUESTION:
+{user_question}
+
+## NARRATIVE ANSWER PROVIDED:
+{narrative}
+
+## RAW EXECUTION RESULTS:
+{execution_result}
 
 ## OUTPUT:
 """
@@ -224,6 +266,14 @@ Rules:
 # 6. CONSTRAINTS: We add rules that guide the LLM away from common mistakes
 #    (like including markdown backticks or calling fig.show()).
 #
+# 7. STATIC FIRST, DYNAMIC LAST: OpenAI (and most other providers) cache
+#    prompts by exact PREFIX match. The intent parser, code writer,
+#    narrative, and critic prompts are split into a *_SYSTEM_PROMPT
+#    (instructions that never change, plus the dataset schema which is
+#    stable for a whole session) and a *_USER_PROMPT (the per-question
+#    values). Anything dynamic placed early in a prompt breaks the cached
+#    prefix for everything after it.
+#
 # HOW TO MODIFY THESE PROMPTS:
 #
 # 1. Make one change at a time and test
@@ -141,10 +141,12 @@ This is the difference between a "pipeline" (fixed steps) and an "agent"
 """
 
 import os
+import atexit
 import asyncio
 import threading
 import concurrent.futures
 from typing import List, Any
+import orjson
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -160,32 +162,60 @@ load_dotenv()
 
 _async_loop = None
 _async_thread = None
+_async_loop_lock = threading.Lock()
 
-def _start_async_loop():
-    """Start a dedicated event loop in a background thread."""
-    global _async_loop
-    _async_loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(_async_loop)
-    _async_loop.run_forever()
+def _start_async_loop(loop, ready):
+    """Run the given event loop in this (background) thread."""
+    asyncio.set_event_loop(loop)
+    # Signal the starting thread once the loop is actually running
+    loop.call_soon(ready.set)
+    loop.run_forever()
 
 def _get_async_loop():
     """Get the dedicated async event loop, starting it if needed."""
     global _async_loop, _async_thread
-    if _async_loop is None or not _async_loop.is_running():
-        _async_thread = threading.Thread(target=_start_async_loop, daemon=True)
-        _async_thread.start()
-        # Wait for the loop to start
-        import time
-        while _async_loop is None or not _async_loop.is_running():
-            time.sleep(0.01)
+    # Fast path: already running (no lock needed to read it)
+    loop = _async_loop
+    if loop is not None and loop.is_running():
+        return loop
+    
+    # The lock makes sure concurrent first callers start only ONE thread
+    with _async_loop_lock:
+        if _async_loop is None or not _async_loop.is_running():
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+            _async_thread = threading.Thread(
+                target=_start_async_loop, args=(loop, ready), daemon=True
+            )
+            _async_thread.start()
+            # Block until the loop runs, instead of polling with sleep()
+            ready.wait()
+            _async_loop = loop
     return _async_loop
 
 def run_async(coro):
-    """Run an async coroutine from sync code using the dedicated event loop."""
+    """
+    Run an async coroutine from sync code using the dedicated event loop.
+    
+    Must not be called from the loop itself (e.g. from a coroutine already
+    running on it): the loop would block waiting for work only it can do,
+    and hang forever. Code on the loop should simply `await` the coroutine.
+    """
     loop = _get_async_loop()
+    if threading.current_thread() is _async_thread:
+        coro.close()
+        raise RuntimeError(
+            "run_async() was called from the MCP event loop itself, which "
+            "would deadlock. Await the coroutine directly instead."
+        )
     future = asyncio.run_coroutine_threadsafe(coro, loop)
     return future.result()
 
+# Start the loop now, while the app is loading, rather than during the first
+# question. Set SHEETS_EAGER_LOOP=0 to start it lazily on first use instead.
+if os.getenv("SHEETS_EAGER_LOOP", "1") == "1":
+    _get_async_loop()
+
 # =============================================================================
 # CONFIGURATION
 # =============================================================================
@@ -197,6 +227,272 @@ def run_async(coro):
 SERVICE_ACCOUNT_PATH = os.getenv("SERVICE_ACCOUNT_PATH", "./credentials/service_account.json")
 DRIVE_FOLDER_ID = os.getenv("DRIVE_FOLDER_ID", "")
 
+# Package spec uvx runs for the MCP server. "@latest" makes uvx check the
+# package index for a newer release on every launch; pinning a version
+# (e.g. "mcp-google-sheets==X.Y.Z") lets it start straight from its cache.
+SHEETS_MCP_PACKAGE = os.getenv("SHEETS_MCP_PACKAGE", "mcp-google-sheets@latest")
+
+# =============================================================================
+# CLIENT CACHE
+# =============================================================================
+# One MultiServerMCPClient per server configuration, shared by every call to
+# get_sheets_tools() / get_sheets_tools_async(). The key is the configuration
+# itself, so changing the credentials, folder or package gets a fresh client.
+# =============================================================================
+
+_client_cache = {}
+_client_cache_lock = threading.Lock()
+
+
+def _get_client():
+    """Return the MultiServerMCPClient for the current configuration."""
+    from langchain_mcp_adapters.client import MultiServerMCPClient
+    
+    key = (SERVICE_ACCOUNT_PATH, DRIVE_FOLDER_ID, SHEETS_MCP_PACKAGE)
+    with _client_cache_lock:
+        if key not in _client_cache:
+            # The client spawns mcp-google-sheets via uvx and communicates via stdio
+            # Note: As of langchain-mcp-adapters 0.1.0, MultiServerMCPClient
+            # cannot be used as a context manager - use client.get_tools() directly
+            _client_cache[key] = MultiServerMCPClient(
+                {
+                    "google-sheets": {
+                        "command": "uvx",
+                        "args": [SHEETS_MCP_PACKAGE],
+                        "env": {
+                            "SERVICE_ACCOUNT_PATH": SERVICE_ACCOUNT_PATH,
+                            "DRIVE_FOLDER_ID": DRIVE_FOLDER_ID
+                        },
+                        "transport": "stdio"
+                    }
+                }
+            )
+        return _client_cache[key]
+
+
+# =============================================================================
+# PERSISTENT SESSION
+# =============================================================================
+# Tools from client.get_tools() open a NEW stdio session for every single
+# call: spawn `uvx mcp-google-sheets`, run the MCP initialize handshake,
+# make one request, shut the process down. An agent turn makes several
+# tool calls, so that overhead was paid several times per question.
+#
+# Instead we keep ONE session open on the background loop and bind the
+# tools to it. The session has to be entered and exited in the same task
+# (anyio's rule), so a long-lived task holds it open until shutdown.
+#
+# If the server process dies, the holding task does NOT notice by itself:
+# it is just waiting for the stop signal. Instead, a tool call that fails
+# with a connection error (see _is_connection_error) drops the session, and
+# the next tool call opens a new one.
+#
+# This state is only touched from the background loop's thread.
+# =============================================================================
+
+_session_state = {"client": None, "task": None, "ready": None, "stop": None, "tools": None}
+
+
+async def _hold_session(client, ready):
+    """Open an MCP session and keep it open until asked to stop."""
+    try:
+        async with client.session("google-sheets") as session:
+            stop = asyncio.Event()
+            _session_state["stop"] = stop
+            ready.set_result(session)
+            await stop.wait()
+    except Exception as error:
+        # Report a failed connect to whoever is waiting. Errors while
+        # closing a session that already died (see _drop_session) end here too.
+        if not ready.done():
+            ready.set_exception(error)
+
+
+def _is_connection_error(error: BaseException) -> bool:
+    """
+    True when `error` means the server connection is gone (not a tool error).
+    
+    When the server process exits, its stdout closes and the MCP session
+    fails every pending and later request with a "Connection closed"
+    McpError; writing to the closed pipe raises one of anyio's stream errors.
+    """
+    import anyio
+    from mcp.shared.exceptions import McpError
+    from mcp.types import CONNECTION_CLOSED
+    
+    if isinstance(error, McpError):
+        return error.error.code == CONNECTION_CLOSED
+    return isinstance(error, (
+        anyio.ClosedResourceError, anyio.BrokenResourceError,
+        anyio.EndOfStream, ConnectionError
+    ))
+
+
+def _drop_session():
+    """Close the current session (if any) so the next call opens a new one."""
+    state = _session_state
+    if state["stop"] is not None:
+        state["stop"].set()
+    state.update(task=None, ready=None, stop=None, tools=None)
+
+
+async def _session_tools(refresh: bool = False) -> dict:
+    """
+    Return {tool name: tool} bound to the live session, opening it if needed.
+    
+    Parameters:
+    -----------
+    refresh : bool
+        Ask the server for its tool list again even if we already have it
+    """
+    from langchain_mcp_adapters.tools import load_mcp_tools
+    
+    state = _session_state
+    client = _get_client()
+    
+    # Configuration changed: close the old server's session
+    if state["client"] is not client and state["stop"] is not None:
+        state["stop"].set()
+    
+    if state["client"] is not client or state["task"] is None or state["task"].done():
+        state.update(client=client, stop=None, tools=None)
+        state["ready"] = asyncio.get_running_loop().create_future()
+        state["task"] = asyncio.ensure_future(_hold_session(client, state["ready"]))
+    
+    session = await state["ready"]
+    
+    if refresh or state["tools"] is None:
+        tools = await load_mcp_tools(session)
+        state["tools"] = {tool.name: tool for tool in tools}
+    
+    return state["tools"]
+
+
+async def _call_session_tool(name: str, arguments: dict):
+    """
+    Call one MCP tool through the persistent session.
+    
+    If the call fails because the connection is gone, the session is dropped
+    before the error is re-raised, so the NEXT call reconnects instead of
+    failing on the dead session until the app restarts.
+    """
+    tools = await _session_tools()
+    if name not in tools:
+        raise RuntimeError(f"MCP tool '{name}' is no longer available on the server.")
+    
+    ready = _session_state["ready"]
+    try:
+        return await tools[name].ainvoke(arguments)
+    except Exception as error:
+        # Only drop the session this call used: a concurrent call may
+        # already have replaced it with a fresh one
+        if _is_connection_error(error) and _session_state["ready"] is ready:
+            _drop_session()
+        raise
+
+
+def _compact_json_text(text: str) -> str:
+    """Re-serialize JSON text without indentation; other text is returned as is."""
+    if "\n" not in text or text.lstrip()[:1] not in ("{", "["):
+        return text
+    try:
+        return orjson.dumps(orjson.loads(text)).decode()
+    except (orjson.JSONDecodeError, orjson.JSONEncodeError):
+        return text
+
+
+def _compact_result(content):
+    """
+    Strip JSON formatting whitespace from a tool result.
+    
+    The MCP server pretty-prints its JSON results (2-space indentation, one
+    value per line). For a sheet read, that whitespace can be a large share
+    of the observation the LLM has to read - and pay for - as input tokens.
+    The data itself is left exactly as it was: same keys, same order, same
+    values. Results come back either as a string or as a list of content
+    blocks ({"type": "text", "text": ...}); both are handled.
+    """
+    if isinstance(content, str):
+        return _compact_json_text(content)
+    if isinstance(content, list):
+        return [
+            {**block, "text": _compact_json_text(block["text"])}
+            if isinstance(block, dict) and isinstance(block.get("text"), str)
+            else block
+            for block in content
+        ]
+    return content
+
+
+def _close_session():
+    """Stop the session task (and with it the server process) at exit."""
+    loop, stop, task = _async_loop, _session_state["stop"], _session_state["task"]
+    if loop is None or not loop.is_running() or stop is None:
+        return
+    
+    async def _stop():
+        stop.set()
+        await asyncio.wait({task}, timeout=5)
+    
+    try:
+        asyncio.run_coroutine_threadsafe(_stop(), loop).result(timeout=6)
+    except Exception:
+        pass
+
+
+atexit.register(_close_session)
+
+
+# =============================================================================
+# WRAP ASYNC TOOLS FOR SYNC INVOCATION
+# =============================================================================
+# The MCP adapter returns StructuredTool objects that only support
+# async invocation. Since our LangGraph workflow runs synchronously,
+# we need to wrap each tool to support sync calls.
+#
+# We use run_async() to execute the coroutine on our dedicated
+# background event loop, which has proper async backend support.
+# Each call looks the tool up on the live session by name, so a
+# reopened session (after the server restarted) is picked up
+# without reloading the tools.
+#
+# The same wrapper also gets an async entry point for
+# get_sheets_tools_async(): it hands the call to the background loop and
+# awaits the result without blocking the caller's loop. Both paths share
+# the one persistent session, so there is only ever one server process.
+#
+# IMPORTANT: We must use StructuredTool (not Tool) to preserve the
+# args_schema, since the LLM sends JSON-structured arguments.
+# =============================================================================
+
+def _wrap_session_tool(async_tool):
+    """Create a sync- and async-compatible wrapper for a session tool."""
+    from langchain_core.tools import StructuredTool
+    
+    tool_name = async_tool.name
+    
+    def sync_invoke(**kwargs):
+        """Sync wrapper that calls the async tool on the background loop."""
+        # ainvoke expects a dict input for structured tools
+        # Results are compacted before they become LLM observations
+        return _compact_result(run_async(_call_session_tool(tool_name, kwargs)))
+    
+    async def async_invoke(**kwargs):
+        """Async wrapper that awaits the tool call on the background loop."""
+        future = asyncio.run_coroutine_threadsafe(
+            _call_session_tool(tool_name, kwargs), _get_async_loop()
+        )
+        return _compact_result(await asyncio.wrap_future(future))
+    
+    # Use StructuredTool to preserve the argument schema
+    return StructuredTool(
+        name=async_tool.name,
+        description=async_tool.description,
+        func=sync_invoke,
+        coroutine=async_invoke,
+        args_schema=async_tool.args_schema if hasattr(async_tool, 'args_schema') else None
+    )
+
 
 def get_sheets_tools() -> List[Any]:
     """
@@ -204,6 +500,7 @@ def get_sheets_tools() -> List[Any]:
     
     This function:
     1. Launches the mcp-google-sheets server as a local subprocess via uvx
+       (once - later calls reuse the running server)
     2. Discovers all available tools exposed by the MCP server
     3. Converts them to LangChain-compatible tool objects
     4. Returns them ready to be bound to an LLM with bind_tools()
@@ -276,42 +573,17 @@ def get_sheets_tools() -> List[Any]:
     # - Stdio communication with the MCP protocol
     # - Tool discovery via the MCP protocol
     # - Conversion to LangChain tool format
+    #
+    # The server process is started once and kept running (see PERSISTENT
+    # SESSION above). Calling this again only re-lists the tools over the
+    # open session.
     # =========================================================================
     
     try:
-        from langchain_mcp_adapters.client import MultiServerMCPClient
-        
-        # We need to keep the client alive for the duration of tool usage
-        # Store it at module level so tools can access it
-        global _mcp_client
-        
-        async def _get_tools():
-            global _mcp_client
-            # Create MCP client with local server configuration
-            # The client spawns mcp-google-sheets via uvx and communicates via stdio
-            # Note: As of langchain-mcp-adapters 0.1.0, MultiServerMCPClient
-            # cannot be used as a context manager - use client.get_tools() directly
-            _mcp_client = MultiServerMCPClient(
-                {
-                    "google-sheets": {
-                        "command": "uvx",
-                        "args": ["mcp-google-sheets@latest"],
-                        "env": {
-                            "SERVICE_ACCOUNT_PATH": SERVICE_ACCOUNT_PATH,
-                            "DRIVE_FOLDER_ID": DRIVE_FOLDER_ID
-                        },
-                        "transport": "stdio"
-                    }
-                }
-            )
-            # Get all tools from the MCP server
-            # This returns LangChain-compatible tool objects (async-only)
-            return await _mcp_client.get_tools()
-        
-        # Run the async function using our dedicated background event loop
+        # Run the discovery using our dedicated background event loop
         # This avoids conflicts with Streamlit's event loop and ensures
         # proper async backend detection by sniffio/anyio
-        async_tools = run_async(_get_tools())
+        async_tools = list(run_async(_session_tools(refresh=True)).values())
         
         if not async_tools:
             raise RuntimeError(
@@ -320,43 +592,8 @@ def get_sheets_tools() -> List[Any]:
                 "Test with: uvx mcp-google-sheets@latest"
             )
         
-        # =====================================================================
-        # WRAP ASYNC TOOLS FOR SYNC INVOCATION
-        # =====================================================================
-        # The MCP adapter returns StructuredTool objects that only support
-        # async invocation. Since our LangGraph workflow runs synchronously,
-        # we need to wrap each tool to support sync calls.
-        #
-        # We use run_async() to execute the coroutine on our dedicated
-        # background event loop, which has proper async backend support.
-        #
-        # IMPORTANT: We must use StructuredTool (not Tool) to preserve the
-        # args_schema, since the LLM sends JSON-structured arguments.
-        # =====================================================================
-        
-        from langchain_core.tools import StructuredTool
-        
-        def create_sync_wrapper(async_tool):
-            """Create a sync-compatible wrapper for an async tool."""
-            
-            # Get the async invoke function
-            async_invoke = async_tool.ainvoke
-            
-            def sync_invoke(**kwargs):
-                """Sync wrapper that calls the async tool on the background loop."""
-                # ainvoke expects a dict input for structured tools
-                return run_async(async_invoke(kwargs))
-            
-            # Use StructuredTool to preserve the argument schema
-            return StructuredTool(
-                name=async_tool.name,
-                description=async_tool.description,
-                func=sync_invoke,
-                args_schema=async_tool.args_schema if hasattr(async_tool, 'args_schema') else None
-            )
-        
-        # Wrap all async tools
-        tools = [create_sync_wrapper(t) for t in async_tools]
+        # Wrap all async tools (see WRAP ASYNC TOOLS FOR SYNC INVOCATION above)
+        tools = [_wrap_session_tool(t) for t in async_tools]
         
         return tools
         
@@ -401,24 +638,13 @@ async def get_sheets_tools_async() -> List[Any]:
         )
     
     try:
-        from langchain_mcp_adapters.client import MultiServerMCPClient
-        
-        # Note: As of langchain-mcp-adapters 0.1.0, MultiServerMCPClient
-        # cannot be used as a context manager - use client.get_tools() directly
-        client = MultiServerMCPClient(
-            {
-                "google-sheets": {
-                    "command": "uvx",
-                    "args": ["mcp-google-sheets@latest"],
-                    "env": {
-                        "SERVICE_ACCOUNT_PATH": SERVICE_ACCOUNT_PATH,
-                        "DRIVE_FOLDER_ID": DRIVE_FOLDER_ID
-                    },
-                    "transport": "stdio"
-                }
-            }
+        # Discover the tools over the shared persistent session (on the
+        # background loop), so sync and async callers use one server process
+        future = asyncio.run_coroutine_threadsafe(
+            _session_tools(refresh=True), _get_async_loop()
         )
-        tools = await client.get_tools()
+        session_tools = await asyncio.wrap_future(future)
+        tools = [_wrap_session_tool(t) for t in session_tools.values()]
         
         if not tools:
             raise RuntimeError(
@@ -31,7 +31,8 @@ User asks question    → mcp_sheets_agent uses tools to find & fetch data
 =============================================================================
 """
 
-from typing import TypedDict, Optional, List
+import operator
+from typing import Annotated, TypedDict, Optional, List
 
 
 class AnalystState(TypedDict, total=False):
@@ -82,10 +83,15 @@ class AnalystState(TypedDict, total=False):
     # READ BY: Streamlit app (to display info about the fetched data)
     # Example: "Data retrieved via MCP agent\nTool calls: 3\nSize: 1,234 rows × 5 columns"
     
-    mcp_tool_calls: List[dict]
+    mcp_tool_calls: Annotated[List[dict], operator.add]
     # A log of which MCP tools the agent called, in order, with their arguments.
     # This is used to display the agent's reasoning process in the UI.
     # Each entry is a dict with: {"tool": str, "args": dict, "result": str}
+    #
+    # The Annotated[..., operator.add] tells LangGraph to CONCATENATE what a
+    # node returns onto the existing list instead of replacing it. A node
+    # only returns its own new entries; it never has to read and copy the
+    # whole log, and several nodes can add to it without overwriting each other.
     # WRITTEN BY: mcp_sheets_agent (logs each tool call during execution)
     # READ BY: Streamlit app (to display the "MCP Tool Calls" expander section)
     # Example: [{"tool": "search_spreadsheets", "args": {"query": "sales"}}, ...]
@@ -125,6 +131,15 @@ class AnalystState(TypedDict, total=False):
     # convert ambiguous natural language into structured, actionable instructions.
     # It reduces errors in downstream code generation.
     
+    intent_details: dict
+    # The same intent broken into fields, for code that wants to inspect it
+    # without re-reading the prose: {"columns": [...], "operation": str,
+    # "filters": str, "output_format": str, "sorting": str}
+    # Empty when the model did not return structured output.
+    #
+    # WRITTEN BY: intent_agent (from the LLM's JSON response)
+    # READ BY: available to downstream agents and the UI
+    
     # =========================================================================
     # CODE GENERATION - Set by code_writer_agent
     # =========================================================================
@@ -198,6 +213,7 @@ class AnalystState(TypedDict, total=False):
     #
     # WRITTEN BY: critic_agent (uses LLM to evaluate the response quality)
     # READ BY: Streamlit app (displays this feedback to the user)
+    #          code_writer_agent (on a retry, as feedback on the rejected code)
     
     critic_score: str
     # Either "PASS" or "FAIL" - a simple binary evaluation.
@@ -206,7 +222,15 @@ class AnalystState(TypedDict, total=False):
     #
     # WRITTEN BY: critic_agent (extracts this from LLM's structured JSON response)
     # READ BY: Streamlit app (shows green checkmark for PASS, red X for FAIL)
+    #          graph.py should_retry() (FAIL sends the run back to code_writer_agent)
     #
     # WHY THIS EXISTS: This is "LLM-as-judge" evaluation - using one LLM call to
     # evaluate the output of another LLM call. It's a common pattern for quality
     # assurance in LLM applications without human review.
+    
+    retry_count: int
+    # How many times code_writer_agent has rewritten the code after a FAIL.
+    # Missing (treated as 0) on the first attempt.
+    #
+    # WRITTEN BY: code_writer_agent (increments it when retrying)
+    # READ BY: graph.py should_retry() (stops retrying after MAX_CODE_RETRIES)
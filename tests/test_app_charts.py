@@ -0,0 +1,49 @@
+"""
+=============================================================================
+TEST_APP_CHARTS.PY - Tests for the large-chart helpers in app.py
+=============================================================================
+Importing app.py runs the Streamlit page in "bare mode" (no server): the
+widgets are created but nothing is submitted, so only the helpers are used.
+=============================================================================
+"""
+
+import base64
+
+import numpy as np
+import orjson
+import pandas as pd
+import plotly.express as px
+
+import app
+
+
+def _decode(value):
+    """Turn a Plotly typed array ({"dtype", "bdata", "shape"}) into NumPy."""
+    array = np.frombuffer(base64.b64decode(value["bdata"]), dtype=value["dtype"])
+    if "shape" in value:
+        array = array.reshape([int(size) for size in value["shape"].split(",")])
+    return array
+
+
+def test_downsampling_keeps_hover_data_aligned_with_points():
+    points = 1000
+    df = pd.DataFrame({
+        "x": np.arange(points, dtype="float64"),
+        "y": np.arange(points, dtype="float64") * 2,
+        "label": np.arange(points, dtype="int64") * 10,
+        "other": np.arange(points, dtype="int64") * 100,
+    })
+    figure = orjson.loads(
+        px.scatter(df, x="x", y="y", hover_data=["label", "other"]).to_json()
+    )
+    
+    assert app.downsample_chart(figure, max_points=100)
+    
+    trace = figure["data"][0]
+    x = _decode(trace["x"])
+    customdata = _decode(trace["customdata"])
+    assert len(x) == 100
+    assert customdata.shape == (100, 2)
+    # Every kept point still carries its own hover values
+    assert np.array_equal(customdata[:, 0], x * 10)
+    assert np.array_equal(customdata[:, 1], x * 100)
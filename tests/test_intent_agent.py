@@ -0,0 +1,90 @@
+"""
+=============================================================================
+TEST_INTENT_AGENT.PY - Tests for agents/intent_agent.py
+=============================================================================
+"""
+
+from collections import OrderedDict
+
+from agents.intent_agent import parse_intent_response
+
+
+def test_structured_response_is_split_into_instruction_and_details():
+    parsed_intent, details = parse_intent_response(
+        '{"instruction": "Sum sales by region", "columns": ["sales", "region"]}'
+    )
+    
+    assert parsed_intent == "Sum sales by region"
+    assert details == {"columns": ["sales", "region"]}
+
+
+def test_plain_text_response_is_used_as_is():
+    assert parse_intent_response("Sum sales by region") == ("Sum sales by region", {})
+
+
+def test_cut_off_response_keeps_a_complete_instruction():
+    text = '{"instruction": "Sum \\"sales\\" by region", "columns": ["sal'
+    
+    assert parse_intent_response(text, "sales by region?") == ('Sum "sales" by region', {})
+
+
+def test_cut_off_instruction_falls_back_to_the_question():
+    text = '{"instruction": "Sum sales by reg'
+    
+    assert parse_intent_response(text, "sales by region?") == ("sales by region?", {})
+
+
+def test_fenced_json_response_is_parsed():
+    text = '```json\n{"instruction": "Sum sales by region", "sorting": ""}\n```'
+    
+    assert parse_intent_response(text) == ("Sum sales by region", {"sorting": ""})
+
+
+class FakeLLM:
+    """Stands in for ChatOpenAI in intent_agent_batch(); counts requests."""
+    
+    temperature = 0
+    model_name = "fake-intent-model"
+    max_tokens = 400
+    model_kwargs = {}
+    
+    def __init__(self):
+        self.requests = 0
+    
+    def batch(self, message_lists, config=None):
+        from langchain_core.messages import AIMessage
+        
+        self.requests += len(message_lists)
+        return [
+            AIMessage(content='{"instruction": "Sum sales by region"}')
+            for _ in message_lists
+        ]
+
+
+def test_batch_sends_repeated_questions_once(monkeypatch):
+    import llm as llm_module
+    from agents import intent_agent
+    
+    # Keep the test away from the real response cache: no disk cache (it
+    # would persist the fake answer into the project's .llm_cache), and
+    # empty in-memory caches so earlier tests can't answer for the LLM
+    monkeypatch.setattr(llm_module, "RESPONSE_CACHE_DIR", "")
+    monkeypatch.setattr(llm_module, "_disk_cache", None)
+    monkeypatch.setattr(llm_module, "_response_cache", OrderedDict())
+    monkeypatch.setattr(intent_agent, "_intent_cache", OrderedDict())
+    
+    llm = FakeLLM()
+    monkeypatch.setattr(intent_agent, "get_llm", lambda *args, **kwargs: llm)
+    summary = "Total Rows: 2\nColumns:\n  - region: object (0 nulls)\n  - sales: int64 (0 nulls)"
+    states = [
+        {"user_question": "Sales by region (batch test)?", "dataframe_summary": summary},
+        {"user_question": "sales by  region (batch test)", "dataframe_summary": summary},
+    ]
+    
+    updates = intent_agent.intent_agent_batch(states)
+    assert [update["parsed_intent"] for update in updates] == ["Sum sales by region"] * 2
+    assert llm.requests == 1
+    
+    # A second batch is answered from the intent cache
+    intent_agent.intent_agent_batch(states)
+    assert llm.requests == 1
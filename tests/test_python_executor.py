@@ -0,0 +1,87 @@
+"""
+=============================================================================
+TEST_PYTHON_EXECUTOR.PY - Tests for tools/python_executor.py
+=============================================================================
+Run from the project root with: python -m pytest -q
+=============================================================================
+"""
+
+import threading
+
+from tools.python_executor import NO_TEXT_RESULT, execute_code
+
+
+def _write_csv(tmp_path):
+    csv_path = tmp_path / "data.csv"
+    csv_path.write_text("region,sales\nNorth,10\nSouth,20\n")
+    return str(csv_path)
+
+
+def test_printed_output_is_used_when_result_text_is_missing(tmp_path):
+    result = execute_code("print('total is', df['sales'].sum())", _write_csv(tmp_path))
+    
+    assert result["success"]
+    assert result["execution_result"] == "total is 30"
+
+
+def test_result_text_wins_over_printed_output(tmp_path):
+    code = "print('debug')\nresult_text = 'answer'"
+    result = execute_code(code, _write_csv(tmp_path))
+    
+    assert result["execution_result"] == "answer"
+
+
+def test_no_output_falls_back_to_default_message(tmp_path):
+    result = execute_code("x = 1", _write_csv(tmp_path))
+    
+    assert result["execution_result"] == NO_TEXT_RESULT
+
+
+def test_concurrent_runs_keep_their_output_separate(tmp_path, capsys):
+    csv_path = _write_csv(tmp_path)
+    barrier = threading.Barrier(2)
+    results = {}
+    
+    # Both runs print at the same time; each must only see its own lines
+    code = "for i in range(2000):\n    print('{name}')\n"
+    
+    def run(name):
+        barrier.wait()
+        results[name] = execute_code(code.format(name=name), csv_path)
+    
+    threads = [threading.Thread(target=run, args=(name,)) for name in ("AAA", "BBB")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    for name, other in (("AAA", "BBB"), ("BBB", "AAA")):
+        output = results[name]["execution_result"]
+        assert name in output
+        assert other not in output
+    
+    # Output outside a run still reaches the real stdout
+    print("after the runs")
+    assert "after the runs" in capsys.readouterr().out
+
+
+def test_common_standard_library_imports_are_allowed(tmp_path):
+    code = (
+        "import warnings\n"
+        "import statistics\n"
+        "from collections import Counter\n"
+        "from itertools import islice\n"
+        "import re\n"
+        "result_text = str(statistics.mean(df['sales']))\n"
+    )
+    result = execute_code(code, _write_csv(tmp_path))
+    
+    assert result["success"], result["execution_result"]
+    assert result["execution_result"] == "15"
+
+
+def test_system_modules_are_rejected(tmp_path):
+    result = execute_code("import os\nresult_text = os.getcwd()", _write_csv(tmp_path))
+    
+    assert not result["success"]
+    assert "import of 'os' is not allowed" in result["execution_result"]
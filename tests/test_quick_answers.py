@@ -0,0 +1,37 @@
+"""
+=============================================================================
+TEST_QUICK_ANSWERS.PY - Tests for the no-LLM shortcuts in the agents
+=============================================================================
+quick_narrative() (narrative_agent.py) and quick_verdict() (critic_agent.py)
+answer clear-cut cases without an LLM call.
+=============================================================================
+"""
+
+from agents.critic_agent import quick_verdict
+from agents.narrative_agent import quick_narrative
+from tools.python_executor import NO_TEXT_RESULT
+
+QUESTION = "Show monthly revenue by region"
+CHART_JSON = '{"data": [], "layout": {}}'
+
+
+def test_chart_only_answer_points_to_the_chart_and_passes():
+    narrative = quick_narrative(QUESTION, NO_TEXT_RESULT, CHART_JSON)
+    
+    assert "chart" in narrative
+    assert quick_verdict(QUESTION, narrative, NO_TEXT_RESULT, CHART_JSON)["score"] == "PASS"
+
+
+def test_no_chart_and_no_text_is_not_described_as_a_chart():
+    narrative = quick_narrative(QUESTION, NO_TEXT_RESULT, None)
+    
+    assert narrative is not None
+    assert "chart" not in narrative.lower()
+    
+    verdict = quick_verdict(QUESTION, narrative, NO_TEXT_RESULT, None)
+    assert verdict["score"] == "FAIL"
+
+
+def test_text_results_still_go_to_the_llm():
+    assert quick_narrative(QUESTION, "North: 10\nSouth: 20", None) is None
+    assert quick_verdict(QUESTION, "Sales were flat.", "North: 10", None) is None
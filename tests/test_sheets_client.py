@@ -0,0 +1,87 @@
+"""
+=============================================================================
+TEST_SHEETS_CLIENT.PY - Tests for the persistent MCP session
+=============================================================================
+A fake client stands in for mcp-google-sheets, so no server is started.
+=============================================================================
+"""
+
+import contextlib
+
+import pytest
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED, ErrorData
+
+import langchain_mcp_adapters.tools
+from sheets_mcp import sheets_client
+
+
+class FakeSession:
+    """A session whose server can be 'killed' by the test."""
+    
+    def __init__(self):
+        self.alive = True
+
+
+class FakeTool:
+    name = "read_sheet"
+    
+    def __init__(self, session):
+        self.session = session
+    
+    async def ainvoke(self, arguments):
+        if not self.session.alive:
+            raise McpError(ErrorData(code=CONNECTION_CLOSED, message="Connection closed"))
+        return f"rows for {arguments['sheet']}"
+
+
+class FakeClient:
+    def __init__(self):
+        self.sessions = []
+    
+    @contextlib.asynccontextmanager
+    async def session(self, server_name):
+        session = FakeSession()
+        self.sessions.append(session)
+        yield session
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    client = FakeClient()
+    
+    async def load_mcp_tools(session):
+        return [FakeTool(session)]
+    
+    monkeypatch.setattr(sheets_client, "_get_client", lambda: client)
+    monkeypatch.setattr(langchain_mcp_adapters.tools, "load_mcp_tools", load_mcp_tools)
+    yield client
+    sheets_client._close_session()
+    sheets_client._session_state.update(
+        client=None, task=None, ready=None, stop=None, tools=None
+    )
+
+
+def _call(sheet):
+    return sheets_client.run_async(
+        sheets_client._call_session_tool("read_sheet", {"sheet": sheet})
+    )
+
+
+def test_calls_share_one_session(fake_client):
+    assert _call("Sales") == "rows for Sales"
+    assert _call("Costs") == "rows for Costs"
+    assert len(fake_client.sessions) == 1
+
+
+def test_dead_server_is_reconnected_on_the_next_call(fake_client):
+    assert _call("Sales") == "rows for Sales"
+    
+    # The server process exits: the call in flight fails...
+    fake_client.sessions[0].alive = False
+    with pytest.raises(McpError):
+        _call("Sales")
+    
+    # ...and the next call opens a new session instead of reusing the dead one
+    assert _call("Sales") == "rows for Sales"
+    assert len(fake_client.sessions) == 2
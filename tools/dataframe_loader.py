@@ -0,0 +1,136 @@
+"""
+=============================================================================
+DATAFRAME_LOADER.PY - Shared, Prefetchable CSV Loading
+=============================================================================
+
+This module loads the pipeline's CSV file into a pandas DataFrame ONCE and
+lets several steps share the result.
+
+WHY PREFETCH?
+-------------
+The LLM call in code_writer_agent takes seconds. During that time the CPU
+is idle, waiting for the network. Parsing the CSV doesn't depend on the
+generated code at all, so we can start it in a background thread BEFORE the
+LLM call and have the DataFrame ready by the time executor_agent runs:
+
+    code_writer_agent:  prefetch_dataframe(csv_path) ──┐  (background thread)
+                        llm call ......................│.........
+    executor_agent:     load_dataframe(csv_path) <─────┘  (already parsed)
+
+HOW THE CACHE STAYS CORRECT:
+---------------------------
+Each entry is keyed by the file path AND its size + modification time.
+mcp_sheets_agent overwrites the same temp file on every analysis, so a new
+fetch changes the signature and the stale frame is never reused.
+
+Callers that might modify the frame should work on a .copy(), since the
+cached object is shared.
+
+PARSING FROM MEMORY:
+-------------------
+mcp_sheets_agent already has the CSV text in memory and parses it once to
+validate it. store_dataframe() registers that parsed frame for the file it
+just wrote, so nothing downstream has to parse the same bytes again.
+
+If pyarrow is installed, read_csv() uses its multi-threaded C++ parser
+(pandas engine="pyarrow"), which is several times faster on large sheets.
+
+=============================================================================
+"""
+
+import os
+import threading
+import concurrent.futures
+from typing import Tuple
+
+import pandas as pd
+
+# pyarrow is optional. Without it we use pandas' default C parser.
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+# Options passed to every pd.read_csv() call made through this module
+_READ_CSV_OPTIONS = {"engine": "pyarrow"} if pyarrow is not None else {}
+
+# Background workers for prefetching (CSV parsing releases the GIL for most
+# of its work, so a thread is enough - no process pool needed)
+_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=2,
+    thread_name_prefix="csv-prefetch"
+)
+
+# csv_path -> (file signature, Future[DataFrame])
+_frames = {}
+_frames_lock = threading.Lock()
+
+
+def _file_signature(csv_path: str) -> Tuple[int, int]:
+    """Return (size, mtime) - changes whenever the file is rewritten."""
+    stat = os.stat(csv_path)
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def read_csv(source) -> pd.DataFrame:
+    """
+    Parse a CSV file path or file-like object with the fastest available engine.
+    """
+    return pd.read_csv(source, **_READ_CSV_OPTIONS)
+
+
+def store_dataframe(csv_path: str, df: pd.DataFrame) -> None:
+    """
+    Register an already-parsed DataFrame as the contents of csv_path.
+
+    Call this right after writing csv_path from df, so later
+    load_dataframe(csv_path) calls return df instead of re-reading the file.
+    The entry is tied to the file's current size + mtime, so it is dropped
+    automatically once the file is rewritten.
+    """
+
+    future = concurrent.futures.Future()
+    future.set_result(df)
+
+    with _frames_lock:
+        _frames[csv_path] = (_file_signature(csv_path), future)
+
+
+def prefetch_dataframe(csv_path: str) -> concurrent.futures.Future:
+    """
+    Start loading the CSV in the background (no-op if already loaded/loading).
+
+    Parameters:
+    -----------
+    csv_path : str
+        Path to the CSV file
+
+    Returns:
+    --------
+    Future
+        Resolves to the DataFrame (or raises the read_csv error)
+    """
+
+    signature = _file_signature(csv_path)
+
+    with _frames_lock:
+        cached = _frames.get(csv_path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        future = _executor.submit(read_csv, csv_path)
+        _frames[csv_path] = (signature, future)
+        return future
+
+
+def load_dataframe(csv_path: str) -> pd.DataFrame:
+    """
+    Return the DataFrame for csv_path, reusing a prefetched/cached copy.
+
+    Blocks until a prefetch that's still running finishes, or loads the
+    file now if nothing was prefetched. Errors from pd.read_csv propagate.
+
+    NOTE: The returned object is shared - use .copy() before modifying it.
+    """
+
+    return prefetch_dataframe(csv_path).result()
@@ -45,13 +45,284 @@ processes or stored in databases. By converting to JSON:
 =============================================================================
 """
 
+import io
+import os
+import sys
+import ast
+import ctypes
+import threading
+from contextlib import contextmanager
 import pandas as pd
 import plotly.express as px
 import plotly.io as pio
+from functools import lru_cache
 from typing import Dict, Any
+from tools.dataframe_loader import load_dataframe
 
 
-def execute_code(code: str, csv_path: str) -> Dict[str, Any]:
+# execution_result when the code ran but set no `result_text` (typically a
+# chart-only answer). narrative_agent recognizes it and skips the LLM.
+NO_TEXT_RESULT = "Code executed successfully. Check the chart for visual results."
+
+# Wall-clock limit for one run of generated code (0 disables the limit)
+EXECUTION_TIMEOUT_SECONDS = float(os.getenv("EXECUTION_TIMEOUT_SECONDS", "30"))
+
+
+class ExecutionTimeout(BaseException):
+    """
+    Raised inside generated code that runs past its time limit.
+    
+    It derives from BaseException (like KeyboardInterrupt), so a broad
+    `except Exception:` in the generated code can't swallow it.
+    """
+
+
+@contextmanager
+def _time_limit(seconds: float):
+    """
+    Interrupt the current thread with ExecutionTimeout after `seconds`.
+    
+    WHY NOT signal.alarm()?
+    Signals are only delivered to the main thread, and Streamlit runs each
+    script (and so the whole pipeline) in a worker thread. Instead, a timer
+    thread asks the interpreter to raise ExecutionTimeout in our thread
+    (PyThreadState_SetAsyncExc). The exception is raised at the next Python
+    bytecode, so it stops any Python loop - but a single long C call (one
+    huge pandas operation, time.sleep()) finishes before it takes effect.
+    """
+    if not seconds or seconds <= 0:
+        yield
+        return
+    
+    thread_id = threading.get_ident()
+    lock = threading.Lock()
+    finished = [False]
+    
+    def _interrupt():
+        # The lock guarantees we never interrupt code after the block ended
+        with lock:
+            if not finished[0]:
+                ctypes.pythonapi.PyThreadState_SetAsyncExc(
+                    ctypes.c_ulong(thread_id), ctypes.py_object(ExecutionTimeout)
+                )
+    
+    timer = threading.Timer(seconds, _interrupt)
+    timer.daemon = True
+    timer.start()
+    try:
+        yield
+    finally:
+        with lock:
+            finished[0] = True
+        timer.cancel()
+
+
+# Error messages longer than this are cut. Some exceptions (a KeyError on a
+# long list, a ValueError quoting data) embed huge values in their text.
+ERROR_MESSAGE_MAX_CHARS = 500
+
+# When the code leaves a DataFrame/Series in result_text instead of a string,
+# at most this many rows/columns of it are turned into text
+RESULT_MAX_ROWS = 50
+RESULT_MAX_COLUMNS = 20
+
+
+def _result_to_text(value) -> str:
+    """
+    Turn whatever the code stored in `result_text` into a string.
+    
+    Strings (the normal case) pass straight through. A DataFrame or Series
+    is rendered with a row/column limit: the code may have stored a whole
+    table (`result_text = df`), and its full text would be huge while only
+    the first part is ever read. Anything else goes through str().
+    """
+    if isinstance(value, str):
+        return value
+    if isinstance(value, pd.DataFrame):
+        return value.to_string(max_rows=RESULT_MAX_ROWS, max_cols=RESULT_MAX_COLUMNS)
+    if isinstance(value, pd.Series):
+        return value.to_string(max_rows=RESULT_MAX_ROWS)
+    return str(value)
+
+
+# Printed output kept from one run (the tail, if it printed more than this)
+PRINTED_OUTPUT_MAX_CHARS = 4096
+
+
+class _ThreadLocalStream:
+    """
+    Stand-in for sys.stdout / sys.stderr that routes writes per thread.
+    
+    WHY NOT contextlib.redirect_stdout()?
+    redirect_stdout() swaps the process-wide sys.stdout. Streamlit runs each
+    session in its own thread and graph.arun_batch() runs several pipelines
+    at once, so one run would capture another run's prints - and two
+    overlapping redirects that exit out of order leave sys.stdout pointing
+    at a dead buffer for the whole server.
+    
+    Instead, this proxy is installed ONCE and never removed. A thread that
+    is running generated code sets its own buffer (see _capture_output);
+    writes from every other thread go to the real stream as before.
+    """
+    
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+    
+    def _target(self):
+        buffer = getattr(self._local, "buffer", None)
+        return self._stream if buffer is None else buffer
+    
+    def write(self, text):
+        target = self._target()
+        if target is None:  # no real stream (e.g. pythonw) - drop the text
+            return len(text)
+        return target.write(text)
+    
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+    
+    def flush(self):
+        target = self._target()
+        if target is not None:
+            target.flush()
+    
+    def __getattr__(self, name):
+        # Everything else (encoding, fileno(), isatty(), ...) is the real stream's
+        return getattr(self._stream, name)
+
+
+_capture_install_lock = threading.Lock()
+
+
+def _install_capture_streams():
+    """Wrap sys.stdout and sys.stderr in a _ThreadLocalStream (once)."""
+    with _capture_install_lock:
+        for name in ("stdout", "stderr"):
+            current = getattr(sys, name)
+            if not isinstance(current, _ThreadLocalStream):
+                setattr(sys, name, _ThreadLocalStream(current))
+        return sys.stdout, sys.stderr
+
+
+@contextmanager
+def _capture_output(buffer: io.StringIO):
+    """
+    Send everything the CURRENT thread writes to stdout/stderr into `buffer`.
+    
+    That covers print() as well as warnings (which are written to stderr).
+    Other threads are not affected.
+    """
+    streams = _install_capture_streams()
+    previous = [getattr(stream._local, "buffer", None) for stream in streams]
+    for stream in streams:
+        stream._local.buffer = buffer
+    try:
+        yield
+    finally:
+        for stream, buffer_before in zip(streams, previous):
+            stream._local.buffer = buffer_before
+
+# How many compiled code objects we keep (least recently used evicted)
+COMPILE_CACHE_SIZE = 64
+
+
+# =============================================================================
+# CODE VALIDATION
+# =============================================================================
+# Before running generated code we walk its syntax tree and refuse the
+# obvious ways an analysis snippet could go wrong: importing modules that
+# touch the system (os, subprocess, socket, shutil, ...), calling
+# eval/exec/open, or reaching into dunder attributes.
+#
+# This is a GUARD AGAINST MISTAKES, NOT A SANDBOX. Modules that are already
+# loaded expose the system anyway (pandas and numpy both reach `os`
+# through their own attributes), so it only stops code that plainly asks
+# for something it shouldn't have. Everything a normal snippet uses -
+# the data libraries plus any pure standard-library module - is allowed,
+# so the check never costs a working answer. See the security notes at the
+# end of this module for what real isolation needs.
+# =============================================================================
+
+# Top-level modules generated code may import: the data libraries and the
+# standard-library modules that compute without touching files, processes,
+# the network or the interpreter itself
+ALLOWED_IMPORTS = frozenset({
+    # Data analysis and charting
+    "pandas", "numpy", "plotly", "dateutil", "pytz", "zoneinfo",
+    # Numbers and statistics
+    "math", "cmath", "statistics", "decimal", "fractions", "numbers", "random",
+    # Dates and times
+    "datetime", "calendar", "time",
+    # Data structures and functional tools
+    "collections", "itertools", "functools", "operator", "heapq", "bisect",
+    "array", "enum", "dataclasses", "copy", "typing", "abc", "contextlib",
+    # Text and formats
+    "re", "string", "textwrap", "unicodedata", "difflib", "json", "csv",
+    "pprint", "html",
+    # Diagnostics
+    "warnings",
+})
+
+# Builtins generated code may not use (called or referenced)
+_FORBIDDEN_NAMES = frozenset({
+    "__import__", "eval", "exec", "compile", "open",
+    "breakpoint", "input", "globals", "locals", "vars",
+})
+
+
+class _CodeValidator(ast.NodeVisitor):
+    """Raise ValueError on the first disallowed construct in a syntax tree."""
+    
+    def _check_module(self, module):
+        if (module or "").split(".")[0] not in ALLOWED_IMPORTS:
+            raise ValueError(f"import of '{module}' is not allowed")
+    
+    def visit_Import(self, node):
+        for alias in node.names:
+            self._check_module(alias.name)
+    
+    def visit_ImportFrom(self, node):
+        if node.level:
+            raise ValueError("relative imports are not allowed")
+        self._check_module(node.module)
+    
+    def visit_Name(self, node):
+        if node.id in _FORBIDDEN_NAMES:
+            raise ValueError(f"use of '{node.id}' is not allowed")
+    
+    def visit_Attribute(self, node):
+        if node.attr.startswith("__") and node.attr.endswith("__"):
+            raise ValueError(f"access to '{node.attr}' is not allowed")
+        self.generic_visit(node)
+
+
+@lru_cache(maxsize=COMPILE_CACHE_SIZE)
+def _compile_code(code: str):
+    """
+    Parse, validate and byte-compile generated code once per source string.
+    
+    exec() on a string re-parses and re-compiles it every time. The same
+    code is often run again (a critic retry that produced identical code,
+    or the same question asked twice), so we cache the code object.
+    The code is parsed once: the same tree is validated (see CODE
+    VALIDATION above) and then compiled.
+    
+    A SyntaxError or a rejected construct (ValueError) is raised here and
+    handled by execute_code() like any other execution error (exceptions
+    are not cached by lru_cache).
+    """
+    tree = ast.parse(code, "<generated_code>", "exec")
+    _CodeValidator().visit(tree)
+    return compile(tree, "<generated_code>", "exec")
+
+
+def execute_code(
+    code: str,
+    csv_path: str,
+    timeout_seconds: float = EXECUTION_TIMEOUT_SECONDS
+) -> Dict[str, Any]:
     """
     Execute generated Python code and extract results.
     
@@ -62,13 +333,18 @@ def execute_code(code: str, csv_path: str) -> Dict[str, Any]:
     -----------
     code : str
         The Python code to execute. This code should:
-        - Expect a variable `csv_path` to be available
+        - Expect the variables `df` (the loaded data) and `csv_path` to be available
         - Store any Plotly figure in a variable called `fig`
         - Store any text output in a variable called `result_text`
         
     csv_path : str
         The path to the CSV file that the code should analyze.
-        This is injected into the execution namespace.
+        This is injected into the execution namespace, along with the
+        DataFrame loaded from it as `df`.
+        
+    timeout_seconds : float
+        Stop the code if it runs longer than this (0 means no limit).
+        Defaults to EXECUTION_TIMEOUT_SECONDS (env var of the same name).
         
     Returns:
     --------
@@ -83,7 +359,6 @@ def execute_code(code: str, csv_path: str) -> Dict[str, Any]:
     >>> code = '''
     ... import pandas as pd
     ... import plotly.express as px
-    ... df = pd.read_csv(csv_path)
     ... fig = px.bar(df, x='category', y='value')
     ... result_text = f"Found {len(df)} rows"
     ... '''
@@ -100,6 +375,8 @@ def execute_code(code: str, csv_path: str) -> Dict[str, Any]:
     # - csv_path: So the generated code knows where the data file is
     # - pd: Pandas module, so the code doesn't need to import it
     # - px: Plotly Express module, so the code doesn't need to import it
+    # - df: The CSV already loaded as a DataFrame (usually prefetched in the
+    #   background while code_writer_agent was waiting for the LLM)
     #
     # WHY PRE-IMPORT MODULES?
     # Some execution environments restrict imports. By providing these,
@@ -112,6 +389,15 @@ def execute_code(code: str, csv_path: str) -> Dict[str, Any]:
         "px": px,               # Plotly Express for charting
     }
     
+    # Inject the pre-loaded DataFrame. We pass a copy because the generated
+    # code may modify df in place, and the cached frame is shared.
+    # If loading fails (missing/empty file), we leave df out and let the
+    # generated code surface the error as it did before.
+    try:
+        local_namespace["df"] = load_dataframe(csv_path).copy()
+    except Exception:
+        pass
+    
     # =========================================================================
     # STEP 2: Execute the code in a try/except block
     # =========================================================================
@@ -125,15 +411,28 @@ def execute_code(code: str, csv_path: str) -> Dict[str, Any]:
     # =========================================================================
     
     try:
-        # exec() runs the code string.
+        # exec() runs the code. We hand it a compiled code object from
+        # _compile_code() rather than the raw string, so repeat runs of the
+        # same code skip parsing and byte-compiling.
         # - First argument: the code to run
         # - Second argument: global namespace (we use the same as local here)
         # - Third argument: local namespace (where variables are stored)
         #
         # After exec() completes, any variables the code created (like `fig`)
         # will be in local_namespace, and we can access them.
+        #
+        # _time_limit() stops code that never finishes (e.g. a `while True`
+        # the LLM got wrong), which would otherwise hang the app forever.
+        #
+        # Anything the code print()s (or warns) is captured in memory
+        # instead of going to the server's console. If the code forgot to
+        # set result_text, the captured output is used as its result (see
+        # STEP 4). _capture_output() is the OUTER block so its cleanup runs
+        # after the time limit is already disarmed.
         
-        exec(code, local_namespace, local_namespace)
+        printed_output = io.StringIO()
+        with _capture_output(printed_output), _time_limit(timeout_seconds):
+            exec(_compile_code(code), local_namespace, local_namespace)
         
         # =====================================================================
         # STEP 3: Extract the Plotly figure (if one was created)
@@ -161,16 +460,17 @@ def execute_code(code: str, csv_path: str) -> Dict[str, Any]:
         # The generated code should create a variable called `result_text`
         # with any text output (tables, summaries, single values, etc.)
         #
-        # If no result_text was created, we provide a default message.
+        # If no result_text was created, we fall back to whatever the code
+        # printed (LLMs sometimes print() their answer), and otherwise
+        # provide a default message.
         # =====================================================================
         
-        result_text = local_namespace.get(
-            "result_text", 
-            "Code executed successfully. Check the chart for visual results."
-        )
+        printed = printed_output.getvalue().strip()
+        default_text = printed[-PRINTED_OUTPUT_MAX_CHARS:] if printed else NO_TEXT_RESULT
+        result_text = local_namespace.get("result_text", default_text)
         
         # Ensure result_text is a string (in case the code stored something else)
-        result_text = str(result_text)
+        result_text = _result_to_text(result_text)
         
         # =====================================================================
         # STEP 5: Return the successful results
@@ -182,6 +482,18 @@ def execute_code(code: str, csv_path: str) -> Dict[str, Any]:
             "success": True                   # Flag indicating success
         }
         
+    except ExecutionTimeout:
+        # Same shape (and "Error executing code" prefix) as any other failure,
+        # so downstream agents treat a timeout as a failed run
+        return {
+            "chart_json": None,
+            "execution_result": (
+                f"Error executing code: TimeoutError: execution timed out "
+                f"after {timeout_seconds:g} seconds"
+            ),
+            "success": False
+        }
+        
     except Exception as error:
         # =====================================================================
         # ERROR HANDLING
@@ -197,7 +509,10 @@ def execute_code(code: str, csv_path: str) -> Dict[str, Any]:
         # - ValueError: Invalid values (e.g., empty data for charts)
         # =====================================================================
         
-        error_message = f"Error executing code: {type(error).__name__}: {str(error)}"
+        error_text = str(error)
+        if len(error_text) > ERROR_MESSAGE_MAX_CHARS:
+            error_text = error_text[:ERROR_MESSAGE_MAX_CHARS] + "..."
+        error_message = f"Error executing code: {type(error).__name__}: {error_text}"
         
         return {
             "chart_json": None,               # No chart since execution failed
@@ -215,13 +530,17 @@ def execute_code(code: str, csv_path: str) -> Dict[str, Any]:
 # 1. SANDBOXING: Run code in a Docker container or restricted environment
 #    that limits filesystem access, network access, and system calls.
 #
-# 2. TIMEOUTS: Add a timeout to prevent infinite loops from hanging.
-#    You can use the `signal` module or multiprocessing with timeout.
+# 2. TIMEOUTS: execute_code() stops Python code after timeout_seconds (see
+#    _time_limit). A single long-running C call can still overrun it; only
+#    a separate process can be killed at an exact deadline.
 #
 # 3. RESOURCE LIMITS: Limit memory and CPU usage to prevent denial-of-service.
 #
-# 4. CODE VALIDATION: Before execution, scan the code for dangerous patterns
-#    like `os.system()`, `subprocess`, `open()` with write mode, etc.
+# 4. CODE VALIDATION: _compile_code() rejects imports outside ALLOWED_IMPORTS,
+#    eval/exec/open and dunder attribute access before anything runs. This
+#    only catches mistakes: objects that are already loaded (pd, np) reach
+#    the system through their attributes, so it doesn't replace
+#    sandboxing (1).
 #
 # 5. RESTRICTED BUILTINS: You can limit what built-in functions are available
 #    by modifying the global namespace passed to exec().